@@ -27,7 +27,12 @@ _version3 = sys.version_info >= (3, 0)
 _integer = int if _version3 else (int, long)
 
 def _load_library():
-	from os import path
+	from os import path, environ
+	
+	# A pure-Python stand-in for machines without a display or a binary.
+	if environ.get('BEARLIBTERMINAL_BACKEND') == 'headless':
+		import headless_terminal
+		return headless_terminal
 	
 	# Figure out where the library binary should be
 	try:
@@ -79,6 +84,13 @@ _library.terminal_bkcolor.argtypes = [ctypes.c_uint32]
 _library.color_from_name8.restype = ctypes.c_uint32
 _color_from_wname.restype = ctypes.c_uint32
 
+# put/state are called once per cell by put_cells, so bind their signatures
+# up front instead of letting ctypes guess on every call.
+_library.terminal_put.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+_library.terminal_put.restype = None
+_library.terminal_state.argtypes = [ctypes.c_int]
+_library.terminal_state.restype = ctypes.c_int
+
 def color_from_name(s):
 	if _version3 or isinstance(s, unicode):
 		return _color_from_wname(s)
@@ -161,6 +173,31 @@ def put(x, y, c):
 		c = ord(c)
 	_library.terminal_put(x, y, c)
 
+def put_cells(xs, ys, codes, colors, bkcolors):
+	"""
+	Draw a batch of cells given as parallel sequences of x, y, codepoint,
+	foreground and background colour (uint32, see color_from_name). Skips
+	markup parsing entirely and only switches colours when they change
+	from one cell to the next. The current colours are restored afterwards.
+	"""
+	_put = _library.terminal_put
+	_color = _library.terminal_color
+	_bkcolor = _library.terminal_bkcolor
+	old_fg = fg = _library.terminal_state(TK_COLOR) & 0xFFFFFFFF
+	old_bg = bg = _library.terminal_state(TK_BKCOLOR) & 0xFFFFFFFF
+	for x, y, c, f, b in zip(xs, ys, codes, colors, bkcolors):
+		if f != fg:
+			_color(f)
+			fg = f
+		if b != bg:
+			_bkcolor(b)
+			bg = b
+		_put(x, y, c)
+	if fg != old_fg:
+		_color(old_fg)
+	if bg != old_bg:
+		_bkcolor(old_bg)
+
 def put_ext(x, y, dx, dy, c, corners=None):
 	if not isinstance(c, _integer):
 		c = ord(c)
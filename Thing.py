@@ -1,9 +1,22 @@
-from uuid import uuid4
+from array import array
+from collections import OrderedDict
 from collections.abc import Sequence
 from enum import IntEnum
-from random import randint, randrange
+from functools import lru_cache
+from itertools import count
 from math import atan2, sqrt, pi
+import random
 import sys
+import tempfile
+from time import perf_counter
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pathfinding import NEIGHBORS
 
 
 class Game_States(IntEnum):
@@ -19,6 +32,15 @@ class LOS_Shape(IntEnum):
     SQUARE = 1
 
 
+class FOV_Algo(IntEnum):
+    SHADOWCAST = 0
+    RAYCAST = 1
+
+
+# (xx, xy, yx, yy) multipliers that map the first octant onto the others.
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
 COLOR = {
     'blue': '#89CCEE',
     'purple': '#332288',
@@ -34,8 +56,135 @@ COLOR = {
     'grey': '#191919',
     }
 
+# How many distinct FOV results a Map remembers before evicting the least
+# recently used one.
+FOV_CACHE_SIZE = 64
+
+# Side length, in tiles, of the buckets Map uses to find rooms by region.
+ROOM_BUCKET_SIZE = 32
+
+# Maps build Tile objects lazily, a CHUNK_SIZE square at a time, and keep at
+# most CHUNK_CACHE_SIZE chunks of them around.
+CHUNK_SIZE = 32
+CHUNK_CACHE_SIZE = 64
+
+# carve_rooms gives up on reaching its room count after this many tries.
+MAX_ROOM_ATTEMPTS = 2000
+# Range of the w and h carve_rooms hands RectRoom, which spans w + 1 by
+# h + 1 tiles, walls included.
+ROOM_SIZE = (2, 10)
+
+# Entity IDs for things that don't belong to a map.
+ORPHAN_IDS = count(1)
+
+# Below this many box tiles times polygon vertices, filling a raycast FOV
+# polygon in pure Python beats NumPy's per-call overhead.
+NUMPY_FILL_MIN_WORK = 1000
+
+# Raycast FOV rays, by (radius, LOS_Shape); see ray_table.
+RAY_TABLES = {}
+
+
+class Glyph:
+    """
+    One interned look: a glyph drawn in a colour over a background. A
+    bkcolor of None leaves the background untouched. Instances are shared,
+    so compare them with `is`.
+    """
+    __slots__ = ('glyph', 'color', 'bkcolor', 'markup')
+
+    def __init__(self, glyph, color, bkcolor=None):
+        self.glyph = glyph
+        self.color = color
+        self.bkcolor = bkcolor
+        if bkcolor is None:
+            self.markup = "[color={}]{}".format(color, glyph)
+        else:
+            self.markup = "[bkcolor={}][color={}]{}".format(bkcolor, color,
+                                                           glyph)
+
+
+# Interned Glyphs, keyed on (glyph, color, bkcolor).
+GLYPHS = {}
+
+
+def intern_glyph(glyph, color, bkcolor=None):
+    key = (glyph, color, bkcolor)
+    entry = GLYPHS.get(key)
+    if entry is None:
+        entry = GLYPHS[key] = Glyph(glyph, color, bkcolor)
+    return entry
+
+
+def markup(glyph, color, bkcolor=None):
+    return intern_glyph(glyph, color, bkcolor).markup
+
+
+@lru_cache(maxsize=4096)
+def bresenham(dx, dy):
+    """
+    Bresenham's line from (0, 0) to (dx, dy), as offsets. A line only
+    depends on where it ends relative to where it starts, so Map.line and
+    RectRoom.line just translate these.
+    """
+    x, y = 0, 0
+    sx = -1 if dx < 0 else 1
+    sy = -1 if dy < 0 else 1
+    dx, dy = abs(dx), abs(dy)
+    plot = []
+    if dx > dy:
+        err = dx / 2.0
+        while x != sx * dx:
+            plot.append((x, y))
+            err -= dy
+            if err < 0:
+                y += sy
+                err += dx
+            x += sx
+    else:
+        err = dy / 2.0
+        while y != sy * dy:
+            plot.append((x, y))
+            err -= dx
+            if err < 0:
+                x += sx
+                err += dy
+            y += sy
+    plot.append((x, y))
+    return tuple(plot)
+
+
+def ray_table(radius, los_shape):
+    """
+    The rays raycast FOV walks, relative to the actor: one for each point of
+    the square ring radius tiles out, leaving out the origin and cut off at
+    the first step that's radius or more away by los_shape. Worked out once
+    per (radius, los_shape), so changing LOS just picks another table.
+    """
+    key = (radius, los_shape)
+    rays = RAY_TABLES.get(key)
+    if rays is None:
+        rays = []
+        for tx, ty in RectRoom(-radius, -radius,
+                               2 * radius, 2 * radius).wall_points:
+            ray = []
+            for dx, dy in bresenham(tx, ty)[1:]:
+                ray.append((dx, dy))
+                if los_shape == LOS_Shape.EUCLID:
+                    distance = sqrt(dx ** 2 + dy ** 2)
+                else:
+                    distance = max(abs(dx), abs(dy))
+                if distance >= radius:
+                    break
+            rays.append(tuple(ray))
+        rays = RAY_TABLES[key] = tuple(rays)
+    return rays
+
 
 class Thing:
+    # Empty so Tile can use __slots__; everything else still gets a __dict__.
+    __slots__ = ()
+
     def __init__(self, x, y, glyph, color, physical, visible=True):
         self.x = x
         self.y = y
@@ -46,6 +195,25 @@ class Thing:
             self.color = color
         self.physical = physical
         self.visible = visible
+        self.world = None
+        self._entity_id = None
+        # Glyphs for [outside FOV, inside FOV], interned on first use.
+        self.looks = [None, None]
+
+    @property
+    def entity_id(self):
+        """
+        A small integer unique within this thing's map, handed out the first
+        time anything asks for it. Most tiles never need one. Things with no
+        map get one from ORPHAN_IDS, and swap it for one of the map's own
+        when Map.add_entity takes them in.
+        """
+        if self._entity_id is None:
+            if self.world is not None:
+                self._entity_id = self.world.new_entity_id()
+            else:
+                self._entity_id = next(ORPHAN_IDS)
+        return self._entity_id
 
     def __eq__(self, other):
         return ((self.glyph, self.color,
@@ -53,26 +221,37 @@ class Thing:
                 (other.glyph, other.color,
                  other.physical, other.visible))
 
+    def clear_looks(self):
+        """Call after changing anything that affects how this looks."""
+        self.looks = [None, None]
+
+    def look(self, within_fov):
+        entry = self.looks[within_fov]
+        if entry is None:
+            bkcolor = None if within_fov else COLOR['grey']
+            entry = intern_glyph(self.glyph, self.color, bkcolor)
+            self.looks[within_fov] = entry
+        return entry
+
     def build_char(self, within_fov):
-        if within_fov:
-            bkcolor = ""
-        else:
-            bkcolor = "[bkcolor={}]".format(COLOR['grey'])
-        elements = [bkcolor, "[color={}]".format(self.color), self.glyph]
-        self.char = "".join(e for e in elements)
+        self.char = self.look(within_fov).markup
+        return self.char
 
 
 class Actor(Thing):
     def __init__(self, world, name, x, y, glyph, color, physical,
                  visible=True, max_health=None, cur_health=None,
                  max_mana=None, cur_mana=None, attack=None, defense=None,
-                 apparel=None):
+                 apparel=None, entity_id=None):
         # Engine Stats
         Thing.__init__(self, x, y, glyph, color, physical)
+        # Set before registering, so a known ID (say from a save) is the
+        # one the map files this actor under.
+        self._entity_id = entity_id
         self.name = name
         self.visible = visible
         self.inventory = []
-        self.uuid = uuid4()
+        self.world = world
         # Generic Stats
         self.max_health = max_health
         self.cur_health = cur_health or max_health
@@ -82,9 +261,17 @@ class Actor(Thing):
         self.defense = defense
         self.base_radius = 8
         self.radius = self.base_radius
+        # 100 is normal speed; see scheduler.NORMAL_SPEED.
+        self.base_speed = 100
+        self.speed = self.base_speed
+        # Called as ai(actor, world) on each of this actor's turns.
+        self.ai = None
         self.los_shape = LOS_Shape.SQUARE
+        self.fov_algo = FOV_Algo.SHADOWCAST
         self.fog_toggle = True
-        self.viewed_map = set()
+        self.viewed_map = TileSet(world.width, world.height)
+        self.fov_key = None
+        self.fov_map = TileSet(0, 0)
         self.apparel = set()
         # Finalization Methods
         world.register(self)
@@ -99,10 +286,27 @@ class Actor(Thing):
         else:
             self.radius = self.base_radius
 
+    def change_fov(self):
+        if self.fov_algo < len(FOV_Algo) - 1:
+            self.fov_algo = FOV_Algo(self.fov_algo + 1)
+        else:
+            self.fov_algo = FOV_Algo(0)
+
     def build_char(self, within_fov):
         super().build_char(within_fov)
-        apparel = "[+]" + [x for x in self.apparel] if self.apparel else ""
-        self.char = "".join((self.char, apparel))
+        if self.apparel:
+            apparel = "[+]" + [x for x in self.apparel]
+            self.char = "".join((self.char, apparel))
+        return self.char
+
+    def take_turn(self, world):
+        """
+        Act once. Returns the cost of the action in turns, or None when
+        there is nothing to do, which lets the scheduler put this to sleep.
+        """
+        if self.ai is None:
+            return None
+        return self.ai(self, world)
 
     def move(self, world, tx, ty):
         tick, moved = world.move_actor(self, tx, ty)
@@ -115,47 +319,122 @@ class Actor(Thing):
         self.x, self.y = start_loc
 
     def adjacent(self, world):
-        adjacent = []
-        for x in range(self.x - 1, self.x + 2):
-            for y in range(self.y - 1, self.y + 2):
-                if x == self.x and y == self.y:
-                    continue
-                else:
-                    adjacent.append((x, y))
-        return adjacent
+        return [(self.x + dx, self.y + dy) for dx, dy in NEIGHBORS]
 
 
 class Item(Thing):
-    def __init__(self, name, x, y, glyph, color, physical):
+    def __init__(self, name, x, y, glyph, color, physical, world=None):
         Thing.__init__(self, x, y, glyph, color, physical)
         self.name = name
-        self.uuid = uuid4()
+        self.world = world
 
 
 class Prop(Thing):
-    def __init__(self, x, y, glyph, color, physical):
+    def __init__(self, x, y, glyph, color, physical, world=None):
         Thing.__init__(self, x, y, glyph, color, physical)
         self.is_door = False
         self.door_status = False
-        self.uuid = uuid4()
+        self.world = world
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
+        self.clear_looks()
 
 
-class Tile(Thing):
-    def __init__(self, x, y, glyph, color, bkcolor, physical):
-        Thing.__init__(self, x, y, glyph, color, physical)
+class TileKind:
+    """
+    Everything about how a tile looks and whether it blocks, shared between
+    every tile that looks the same. Kinds are interned by tile_kind and never
+    change; a tile that changes just points at a different kind.
+    """
+    __slots__ = ('glyph', 'color', 'bkcolor', 'physical', 'visible', 'looks')
+
+    def __init__(self, glyph, color, bkcolor, physical, visible=True):
+        self.glyph = glyph
+        self.color = color
         self.bkcolor = bkcolor
+        self.physical = physical
+        self.visible = visible
+        # Glyphs for [outside FOV, inside FOV], interned on first use.
+        self.looks = [None, None]
+
+    def replace(self, **changes):
+        fields = {key: getattr(self, key) for key in KIND_FIELDS}
+        fields.update(changes)
+        return tile_kind(**fields)
+
+    def look(self, within_fov):
+        entry = self.looks[within_fov]
+        if entry is None:
+            bkcolor = self.bkcolor if within_fov else COLOR['grey']
+            entry = intern_glyph(self.glyph, self.color, bkcolor)
+            self.looks[within_fov] = entry
+        return entry
+
+
+KIND_FIELDS = ('glyph', 'color', 'bkcolor', 'physical', 'visible')
+# Interned TileKinds, keyed on KIND_FIELDS.
+TILE_KINDS = {}
+
+
+def tile_kind(glyph, color, bkcolor, physical, visible=True):
+    key = (glyph, color, bkcolor, physical, visible)
+    kind = TILE_KINDS.get(key)
+    if kind is None:
+        # setdefault, so two threads generating maps agree on one kind.
+        kind = TILE_KINDS.setdefault(key, TileKind(glyph, color, bkcolor,
+                                                   physical, visible))
+    return kind
+
+
+def _kind_field(name):
+    def getter(self):
+        return getattr(self.kind, name)
+
+    def setter(self, value):
+        self.kind = self.kind.replace(**{name: value})
+        self.sync()
+    return property(getter, setter)
+
+
+class Tile(Thing):
+    __slots__ = ('x', 'y', 'kind', 'occupied', 'prop', 'item', 'world',
+                 '_entity_id', 'char')
+
+    glyph = _kind_field('glyph')
+    color = _kind_field('color')
+    bkcolor = _kind_field('bkcolor')
+    physical = _kind_field('physical')
+    visible = _kind_field('visible')
+
+    def __init__(self, x, y, glyph, color, bkcolor, physical, world=None):
+        self.x = x
+        self.y = y
+        self.kind = tile_kind(glyph, color, bkcolor, physical)
         self.occupied = None
         self.prop = None
         self.item = None
-        self.uuid = uuid4()
+        self.world = world
+        self._entity_id = None
+
+    @classmethod
+    def of_kind(cls, kind, x, y, world=None):
+        """Build a tile straight from an interned TileKind."""
+        tile = cls.__new__(cls)
+        tile.x = x
+        tile.y = y
+        tile.kind = kind
+        tile.occupied = None
+        tile.prop = None
+        tile.item = None
+        tile.world = world
+        tile._entity_id = None
+        return tile
 
     def __eq__(self, other):
-        return ((self.glyph, self.color, self.physical, self.door[0]) ==
-                (other.glyph, other.color, other.physical, other.door[0]))
+        return ((self.kind, bool(self.check_door())) ==
+                (other.kind, bool(other.check_door())))
 
     def __str__(self):
         return "x: {}, "
@@ -167,19 +446,31 @@ class Tile(Thing):
         "occupied: {}, "
         "prop: {}, "
         "item: {}, "
-        "uuid: {}".format(self.x, self.y, self.glyph, self.char, self.color,
-                          self.physical, self.occupied, self.prop, self.item,
-                          self.uuid)
+        "entity_id: {}".format(self.x, self.y, self.glyph, self.char,
+                               self.color, self.physical, self.occupied,
+                               self.prop, self.item, self.entity_id)
 
     def update(self, **kwargs):
+        style = {key: kwargs.pop(key) for key in KIND_FIELDS if key in kwargs}
+        if style:
+            self.kind = self.kind.replace(**style)
         for key, value in kwargs.items():
             setattr(self, key, value)
+        self.sync()
+
+    def sync(self):
+        """Push this tile's state into its map's dense layers, if any."""
+        if self.world is not None:
+            self.world.sync_tile(self)
 
     def build_door(self):
-        self.update(glyph='.', physical=False)
         self.prop = Prop(x=self.x, y=self.y, glyph='+',
-                         color=COLOR['white'], physical=True)
+                         color=COLOR['white'], physical=True,
+                         world=self.world)
         self.prop.update(is_door=True, door_status=True)
+        if self.world is not None:
+            self.world.add_entity(self.prop)
+        self.update(glyph='.', physical=False)
 
     def check_door(self):
         if self.prop and self.prop.is_door:
@@ -189,37 +480,231 @@ class Tile(Thing):
         self.prop.door_status = not self.prop.door_status
         self.prop.glyph = ["-", "+"][self.prop.door_status]
         self.prop.physical = not self.prop.physical
+        self.prop.clear_looks()
+        self.sync()
 
-    def build_char(self, fov_map, fog_toggle=True):
+    def within_fov(self, fov_map, fog_toggle=True):
         # Only for debugging purposes. In production, this won't be accessible.
         if fog_toggle:
-            if (self.x, self.y) in fov_map:
-                within_fov = True
-            else:
-                within_fov = False
-        else:
-            within_fov = True
+            return (self.x, self.y) in fov_map
+        return True
+
+    def look(self, fov_map, fog_toggle=True):
+        """The interned Glyph for whatever is drawn on top of this tile."""
+        return self.look_within(self.within_fov(fov_map, fog_toggle))
 
+    def look_within(self, within_fov):
         if self.occupied:
-            self.occupied.build_char(within_fov)
+            return self.occupied.look(within_fov)
         elif self.item:
-            self.item.build_char(within_fov)
+            return self.item.look(within_fov)
         elif self.prop:
-            self.prop.build_char(within_fov)
-        else:
-            super().build_char(within_fov)
-            if within_fov:
-                bkcolor = "[bkcolor={}]".format(self.bkcolor)
-            else:
-                bkcolor = "[bkcolor={}]".format(COLOR['grey'])
-            color = "[color={}]".format(self.color)
-            elements = [bkcolor, color, self.glyph]
-            self.char = "".join(e for e in elements)
+            return self.prop.look(within_fov)
+        return self.kind.look(within_fov)
+
+    def build_char(self, fov_map, fog_toggle=True):
+        within_fov = self.within_fov(fov_map, fog_toggle)
+        if self.occupied:
+            return self.occupied.build_char(within_fov)
+        elif self.item:
+            return self.item.build_char(within_fov)
+        elif self.prop:
+            return self.prop.build_char(within_fov)
+        self.char = self.kind.look(within_fov).markup
+        return self.char
+
+
+class Column(Sequence):
+    """world[x]: the tiles in column x, built as they're asked for."""
+    __slots__ = ('world', 'x')
+
+    def __init__(self, world, x):
+        self.world = world
+        self.x = x
+
+    def __getitem__(self, y):
+        world = self.world
+        if type(y) is int and 0 <= y < world.height:
+            return world.tile(self.x, y)
+        if isinstance(y, slice):
+            return [world.tile(self.x, i)
+                    for i in range(*y.indices(world.height))]
+        if -world.height <= y < 0:
+            return world.tile(self.x, y + world.height)
+        raise IndexError('tile index out of range')
+
+    def __len__(self):
+        return self.world.height
+
+
+class Chunk:
+    """The Tile objects of one CHUNK_SIZE square of a map, by column."""
+    __slots__ = ('x', 'y', 'columns', 'dirty')
+
+    def __init__(self, x, y, columns):
+        self.x = x
+        self.y = y
+        self.columns = columns
+        # Set once a tile changes after the chunk was built, since then it
+        # can't just be painted again from the map's rooms.
+        self.dirty = False
+
+
+class ChunkStore:
+    """
+    Tile kinds of evicted chunks that had changed, zlib'd into a temporary
+    file. Chunks that never changed aren't stored at all; they're painted
+    again from the rooms when they're next needed.
+    """
+    def __init__(self):
+        self.file = None
+        self.index = {}
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def save(self, key, codes):
+        data = zlib.compress(codes.tobytes())
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(0, 2)
+        self.index[key] = (self.file.tell(), len(data))
+        self.file.write(data)
+
+    def load(self, key):
+        codes = self.read(key)
+        del self.index[key]
+        return codes
+
+    def read(self, key):
+        """Like load, but the chunk stays stored."""
+        offset, size = self.index[key]
+        self.file.seek(offset)
+        codes = array('H')
+        codes.frombytes(zlib.decompress(self.file.read(size)))
+        return codes
+
+    def clear(self):
+        self.index.clear()
+        if self.file is not None:
+            self.file.seek(0)
+            self.file.truncate()
+
+
+class TileSet:
+    """
+    A set of (x, y) points inside a rectangle, a byte per point, indexed
+    by (x - x0) * height + (y - y0) like the Map layers. Membership is an
+    index and a whole map's worth of explored tiles costs a byte a tile.
+    Points outside the rectangle are never in it and are dropped on add.
+    """
+    __slots__ = ('x0', 'y0', 'width', 'height', 'bits')
+
+    def __init__(self, width, height, x0=0, y0=0, points=()):
+        self.x0 = x0
+        self.y0 = y0
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        self.bits = bytearray(self.width * self.height)
+        self.update(points)
+
+    @classmethod
+    def from_points(cls, points, width, height):
+        """Just big enough for points, clipped to a width x height map."""
+        points = [(x, y) for x, y in points
+                  if 0 <= x < width and 0 <= y < height]
+        if not points:
+            return cls(0, 0)
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        x0, y0 = min(xs), min(ys)
+        return cls(max(xs) - x0 + 1, max(ys) - y0 + 1, x0, y0, points)
+
+    def index(self, x, y):
+        """Where x, y lives in bits, or -1 if it can't be in this set."""
+        x -= self.x0
+        y -= self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return x * self.height + y
+        return -1
+
+    def __contains__(self, point):
+        x, y = point
+        x -= self.x0
+        y -= self.y0
+        return (0 <= x < self.width and 0 <= y < self.height
+                and self.bits[x * self.height + y] == 1)
+
+    def __len__(self):
+        return self.bits.count(1)
+
+    def __iter__(self):
+        bits, height = self.bits, self.height
+        idx = bits.find(1)
+        while idx >= 0:
+            yield (self.x0 + idx // height, self.y0 + idx % height)
+            idx = bits.find(1, idx + 1)
+
+    def __eq__(self, other):
+        if isinstance(other, (TileSet, set, frozenset)):
+            return set(self) == set(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def add(self, point):
+        idx = self.index(*point)
+        if idx >= 0:
+            self.bits[idx] = 1
+
+    def update(self, points):
+        if isinstance(points, TileSet):
+            self._merge(points)
+            return
+        for x, y in points:
+            idx = self.index(x, y)
+            if idx >= 0:
+                self.bits[idx] = 1
+
+    def _merge(self, other):
+        # Column by column, each one OR'd as a big int.
+        y0 = max(self.y0, other.y0)
+        y1 = min(self.y0 + self.height, other.y0 + other.height)
+        if y0 >= y1:
+            return
+        size = y1 - y0
+        for x in range(max(self.x0, other.x0),
+                       min(self.x0 + self.width, other.x0 + other.width)):
+            mine = self.index(x, y0)
+            theirs = other.index(x, y0)
+            merged = (int.from_bytes(self.bits[mine:mine + size], 'big')
+                      | int.from_bytes(other.bits[theirs:theirs + size],
+                                       'big'))
+            self.bits[mine:mine + size] = merged.to_bytes(size, 'big')
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+
+    def column(self, x, y0, y1):
+        """Bytes saying which of (x, y0) up to (x, y1) are in the set."""
+        dx = x - self.x0
+        if (0 <= dx < self.width and self.y0 <= y0
+                and y1 <= self.y0 + self.height):
+            start = dx * self.height + y0 - self.y0
+            return self.bits[start:start + y1 - y0]
+        top = max(y0, self.y0)
+        bottom = min(y1, self.y0 + self.height)
+        if not self.x0 <= x < self.x0 + self.width or top >= bottom:
+            return bytes(y1 - y0)
+        start = self.index(x, top)
+        return (bytes(top - y0) + self.bits[start:start + bottom - top]
+                + bytes(y1 - bottom))
 
 
 class Map(Sequence):
     def __init__(self, name, width, height,
-                 min_rooms, max_rooms, num_exits, level, region):
+                 min_rooms, max_rooms, num_exits, level, region, seed=None,
+                 generate=True):
         self.name = name
         self.width = width
         self.height = height
@@ -227,57 +712,312 @@ class Map(Sequence):
         self.max_rooms = max_rooms
         self.num_exits = num_exits
         self.level = level
-        self.layout = []
-        self.fov_map = set()
+        # Tiles only exist for chunks somebody looked at recently; the rest
+        # of the map is the layers below plus the rooms.
+        self.columns = []
+        self.chunks = OrderedDict()
+        self.chunk_store = ChunkStore()
+        # Tile kinds of stored chunks are kept as indexes into palette.
+        self.palette = []
+        self.palette_codes = {}
+        # Dense layers, indexed by x * height + y. Tiles push changes into
+        # these through sync_tile so the hot loops never touch a Tile.
+        self.opaque = bytearray()
+        self.walkable = bytearray()
+        self.occupied = bytearray()
+        self.fov_map = TileSet(0, 0)
+        self.fov_cache = OrderedDict()
+        # Bumped whenever something that affects sight changes, so stale
+        # FOV results can never be served from the cache.
+        self.revision = 0
+        # Index of every tile whose opacity or walkability changed, in
+        # order. Replaced, not cleared, on regeneration, so anything
+        # following it can tell the map was rebuilt.
+        self.tile_changes = []
+        # Entity IDs are handed out lazily and never reused, even across
+        # regenerations.
+        self.entity_ids = count(1)
+        # Registry of actors, items and props, by entity ID and by position.
+        self.entities = {}
+        self.entity_positions = {}
+        self.entities_by_pos = {}
         self.rooms = []
+        self.bounds = None
+        # Every wall point of every room, plus a bucket grid of rooms so
+        # region queries don't have to scan the whole room list.
+        self.wall_index = set()
+        self.room_buckets = {}
         self.passages = []
         self.region = region
         self.start_loc = None
-        self.generate_map(width, height, num_exits)
+        # Everything generation rolls comes from rng, seeded with seed, so
+        # a map can be made again from its settings and seed alone.
+        self.seed = None
+        self.rng = None
+        self.generation_stats = {}
+        # Left empty when something else, like savefile.load, is going to
+        # fill the map in.
+        if generate:
+            self.generate_map(width, height, num_exits, seed)
 
     def __getitem__(self, key):
-        return self.layout[key]
+        return self.columns[key]
+
+    def tile(self, x, y):
+        # Doesn't count as a use for eviction; warm does that for whatever
+        # is on screen, and an evicted chunk is only ever rebuilt, not lost.
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            chunk = self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)
+        return chunk.columns[x % CHUNK_SIZE][y % CHUNK_SIZE]
+
+    def chunk(self, cx, cy):
+        """The chunk at chunk coordinates cx, cy, built if need be."""
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = self.build_chunk(cx, cy)
+            if len(self.chunks) > CHUNK_CACHE_SIZE:
+                self.evict_chunk()
+        else:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def warm(self, x, y, width, height):
+        """Make sure the chunks covering a rectangle are built and fresh."""
+        x0, y0 = max(x, 0), max(y, 0)
+        x1 = min(x + width, self.width) - 1
+        y1 = min(y + height, self.height) - 1
+        for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+            for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1):
+                self.chunk(cx, cy)
+
+    def evict_chunk(self):
+        key, chunk = self.chunks.popitem(last=False)
+        if chunk.dirty:
+            code = self.palette_code
+            self.chunk_store.save(key, array('H', (
+                code(tile.kind) for column in chunk.columns
+                for tile in column)))
+
+    def palette_code(self, kind):
+        code = self.palette_codes.get(kind)
+        if code is None:
+            code = self.palette_codes[kind] = len(self.palette)
+            self.palette.append(kind)
+        return code
+
+    def chunk_bounds(self, cx, cy):
+        x0, y0 = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        return (x0, y0, min(x0 + CHUNK_SIZE, self.width),
+                min(y0 + CHUNK_SIZE, self.height))
+
+    def paint_chunk(self, cx, cy):
+        """
+        Tile kinds for a chunk, by column, worked out from the rooms and
+        doors the same way carving them into real tiles would have.
+        """
+        x0, y0, x1, y1 = self.chunk_bounds(cx, cy)
+        kinds = [[self.ground] * (y1 - y0) for x in range(x0, x1)]
+        for room in self.rooms_in(x0, y0, x1 - 1, y1 - 1):
+            for x in range(max(room.x_left, x0), min(room.x_right, x1 - 1) + 1):
+                column = kinds[x - x0]
+                edge = x in (room.x_left, room.x_right)
+                for y in range(max(room.y_top, y0),
+                               min(room.y_bottom, y1 - 1) + 1):
+                    if edge or y in (room.y_top, room.y_bottom):
+                        column[y - y0] = self.wall
+                    elif room is not self.bounds:
+                        column[y - y0] = self.floor
+        for x in range(x0, x1):
+            column = kinds[x - x0]
+            for y in range(y0, y1):
+                if any(getattr(thing, 'is_door', False)
+                       for thing in self.entities_by_pos.get((x, y), ())):
+                    column[y - y0] = column[y - y0].replace(glyph='.',
+                                                            physical=False)
+        return kinds
+
+    def build_chunk(self, cx, cy):
+        x0, y0, x1, y1 = self.chunk_bounds(cx, cy)
+        key = (cx, cy)
+        if key in self.chunk_store:
+            codes = iter(self.chunk_store.load(key))
+            palette = self.palette
+            kinds = [[palette[next(codes)] for y in range(y0, y1)]
+                     for x in range(x0, x1)]
+            dirty = True
+        else:
+            kinds = self.paint_chunk(cx, cy)
+            dirty = False
+        of_kind = Tile.of_kind
+        columns = [[of_kind(kind, x, y, self)
+                    for y, kind in zip(range(y0, y1), kinds[x - x0])]
+                   for x in range(x0, x1)]
+        entities_by_pos = self.entities_by_pos
+        for x in range(x0, x1):
+            column = columns[x - x0]
+            for y in range(y0, y1):
+                for thing in entities_by_pos.get((x, y), ()):
+                    tile = column[y - y0]
+                    if isinstance(thing, Actor):
+                        tile.occupied = thing
+                    elif isinstance(thing, Item):
+                        tile.item = thing
+                    elif isinstance(thing, Prop):
+                        tile.prop = thing
+        chunk = Chunk(x0, y0, columns)
+        chunk.dirty = dirty
+        return chunk
 
     def __len__(self):
         return self.width * self.height
 
     def __contains__(self, item):
-        for tiles in self.layout:
-            for tile in tiles:
-                if isinstance(item, Tile):
-                    if item == tile:
-                        return True
-                elif isinstance(item, Actor):
-                    if item == tile.occupied:
-                        return True
-                elif isinstance(item, Item):
-                    if item == tile.item:
-                        return True
-                elif isinstance(item, Prop):
-                    if item == tile.prop:
-                        return True
+        if isinstance(item, Tile):
+            return (self.in_bounds(item.x, item.y)
+                    and self[item.x][item.y] is item)
+        elif isinstance(item, (Actor, Item, Prop)):
+            # Not entity_id, which would hand an unregistered item an ID.
+            return (item._entity_id is not None
+                    and self.entities.get(item._entity_id) is item)
         return False
 
+    def add_entity(self, entity):
+        """
+        Track an actor, item or prop in the registry at its current
+        position. Adding something already registered just moves it.
+        """
+        if entity.world is not self:
+            # IDs are only unique within a map, so one from another map,
+            # or from ORPHAN_IDS, may already be taken here.
+            entity._entity_id = None
+            entity.world = self
+        if self.entities.get(entity.entity_id) is entity:
+            self.move_entity(entity, entity.x, entity.y)
+            return
+        self.entities[entity.entity_id] = entity
+        self.entity_positions[entity.entity_id] = (entity.x, entity.y)
+        self.entities_by_pos.setdefault((entity.x, entity.y),
+                                        []).append(entity)
+
+    def remove_entity(self, entity):
+        if entity not in self:
+            return
+        pos = self.entity_positions.pop(entity.entity_id)
+        del self.entities[entity.entity_id]
+        here = self.entities_by_pos[pos]
+        # By identity: Thing.__eq__ would match any look-alike on the tile.
+        for i, other in enumerate(here):
+            if other is entity:
+                del here[i]
+                break
+        if not here:
+            del self.entities_by_pos[pos]
+
+    def move_entity(self, entity, x, y):
+        """Re-file a registered entity under (x, y)."""
+        self.remove_entity(entity)
+        self.entities[entity.entity_id] = entity
+        self.entity_positions[entity.entity_id] = (x, y)
+        self.entities_by_pos.setdefault((x, y), []).append(entity)
+
+    def entities_at(self, x, y):
+        return tuple(self.entities_by_pos.get((x, y), ()))
+
+    def place_item(self, item, x, y):
+        item.x, item.y = x, y
+        self.tile(x, y).item = item
+        self.add_entity(item)
+
+    def window(self, x, y, width, height):
+        """
+        Columns of tiles inside the rectangle at (x, y) with the given size,
+        clipped to the map. Columns are pieced together from slices of
+        chunk columns, so the cost depends on the size of the window rather
+        than the size of the map.
+        """
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        rows = [(cy, cy * CHUNK_SIZE) for cy in
+                range(y0 // CHUNK_SIZE, (y1 - 1) // CHUNK_SIZE + 1)]
+        window = []
+        for x in range(x0, x1):
+            cx, offset = divmod(x, CHUNK_SIZE)
+            column = []
+            for cy, base in rows:
+                column.extend(self.chunk(cx, cy).columns[offset][
+                    max(y0 - base, 0):y1 - base])
+            window.append(column)
+        return window
+
+    def new_entity_id(self):
+        return next(self.entity_ids)
+
+    def index(self, x, y):
+        return x * self.height + y
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def sync_tile(self, tile):
+        idx = tile.x * self.height + tile.y
+        closed_door = bool(tile.check_door() and tile.prop.door_status)
+        opaque = bool(tile.physical or closed_door)
+        walkable = not tile.physical
+        if self.opaque[idx] != opaque:
+            self.opaque[idx] = opaque
+            self.revision += 1
+            self.tile_changes.append(idx)
+        if self.walkable[idx] != walkable:
+            self.walkable[idx] = walkable
+            self.tile_changes.append(idx)
+        self.occupied[idx] = tile.occupied is not None
+        chunk = self.chunks.get((tile.x // CHUNK_SIZE, tile.y // CHUNK_SIZE))
+        if chunk is not None:
+            chunk.dirty = True
+
     def register(self, actor):
-        self[actor.x][actor.y].occupied = actor
+        self.tile(actor.x, actor.y).occupied = actor
+        self.occupied[actor.x * self.height + actor.y] = True
+        self.add_entity(actor)
+
+    def unregister(self, actor):
+        """Take actor off this map, say when it leaves for another one."""
+        tile = self.tile(actor.x, actor.y)
+        if tile.occupied is actor:
+            tile.occupied = None
+            self.occupied[actor.x * self.height + actor.y] = False
+        self.remove_entity(actor)
 
     def move_actor(self, actor, tx, ty):
         dx, dy = actor.x + tx, actor.y + ty
         if tx == 0 and ty == 0:
             return (True, False)
-        if not (dx >= self.width) or (dy >= self.height):
-            if not self[dx][dy].physical:
-                if self[dx][dy].check_door() and self[dx][dy].prop.door_status:
-                    self[dx][dy].toggle_door()
+        if self.in_bounds(dx, dy):
+            idx = dx * self.height + dy
+            if self.walkable[idx]:
+                tile = self.tile(dx, dy)
+                if tile.check_door() and tile.prop.door_status:
+                    tile.toggle_door()
                     return (True, False)
-                elif not self[dx][dy].occupied:
-                    self[actor.x][actor.y].occupied = None
-                    self[dx][dy].occupied = actor
+                elif not self.occupied[idx]:
+                    self.tile(actor.x, actor.y).occupied = None
+                    self.occupied[actor.x * self.height + actor.y] = False
+                    tile.occupied = actor
+                    self.occupied[idx] = True
+                    self.move_entity(actor, dx, dy)
                     return (True, True)
         return (False, False)
 
     def line(self, x0, y0, x1, y1, halt=False):
-        """Bresenham's line algorithm"""
+        """
+        Bresenham's line algorithm. Unless halt is set the line keeps going
+        past (x1, y1) to the edge of the map.
+        """
+        if halt:
+            return [(x0 + dx, y0 + dy)
+                    for dx, dy in bresenham(x1 - x0, y1 - y0)]
         dx = abs(x1 - x0)
         dy = abs(y1 - y0)
         x, y = x0, y0
@@ -286,44 +1026,121 @@ class Map(Sequence):
         plot = []
         if dx > dy:
             err = dx / 2.0
-            if halt:
-                while x != x1:
-                    plot.append((x, y))
-                    err -= dy
-                    if err < 0:
-                        y += sy
-                        err += dx
-                    x += sx
-            else:
-                while 0 <= x < self.width:
-                    plot.append((x, y))
-                    err -= dy
-                    if err < 0:
-                        y += sy
-                        err += dx
-                    x += sx
+            while 0 <= x < self.width:
+                plot.append((x, y))
+                err -= dy
+                if err < 0:
+                    y += sy
+                    err += dx
+                x += sx
         else:
             err = dy / 2.0
-            if halt:
-                while y != y1:
-                    plot.append((x, y))
-                    err -= dx
-                    if err < 0:
-                        x += sx
-                        err += dy
-                    y += sy
-            else:
-                while 0 <= y < self.height:
-                    plot.append((x, y))
-                    err -= dx
-                    if err < 0:
-                        x += sx
-                        err += dy
-                    y += sy
+            while 0 <= y < self.height:
+                plot.append((x, y))
+                err -= dx
+                if err < 0:
+                    x += sx
+                    err += dy
+                y += sy
         plot.append((x, y))
         return plot
 
     def calculate_fov(self, actor):
+        key = (actor.x, actor.y, actor.radius, actor.los_shape,
+               actor.fov_algo, self.revision)
+        if key == actor.fov_key:
+            # Nothing has moved or changed since the last frame.
+            self.fov_map = actor.fov_map
+            return
+        fov = self.fov_cache.get(key)
+        if fov is None:
+            if actor.fov_algo == FOV_Algo.SHADOWCAST:
+                points = self.shadowcast_fov(actor)
+            else:
+                points = self.raycast_fov(actor)
+            fov = TileSet.from_points(points, self.width, self.height)
+            self.fov_cache[key] = fov
+            if len(self.fov_cache) > FOV_CACHE_SIZE:
+                self.fov_cache.popitem(last=False)
+        else:
+            self.fov_cache.move_to_end(key)
+        actor.viewed_map.update(fov)
+        actor.fov_key = key
+        actor.fov_map = fov
+        self.fov_map = fov
+
+    def is_opaque(self, x, y):
+        """
+        Walls block sight, and so do closed doors. Anything off the edge of
+        the map is treated as solid rock.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+        return bool(self.opaque[x * self.height + y])
+
+    def shadowcast_fov(self, actor):
+        """
+        Recursive shadowcasting, adapted from:
+        http://www.roguebasin.com/index.php?title=FOV_using_recursive_shadowcasting
+        Scans each of the eight octants row by row outward from the actor,
+        asking only whether a tile is opaque. Light stops at the first
+        opaque tile, but that tile is itself visible, so walls and closed
+        doors show up the same way they do in the raycast version.
+
+        The two only agree on every floor tile from the middle of a room.
+        Anywhere else they can disagree about a few floor tiles just past
+        the end of a wall: the raycast joins its ray ends with straight
+        lines, which cut some of those tiles off and take in others at
+        shallow angles that shadowcasting counts as hidden.
+        """
+        fov = {(actor.x, actor.y)}
+        for xx, xy, yx, yy in OCTANTS:
+            self._cast_light(fov, actor, 1, 1.0, 0.0, xx, xy, yx, yy)
+        return fov
+
+    def _cast_light(self, fov, actor, row, start, end, xx, xy, yx, yy):
+        if start < end:
+            return
+        radius = actor.radius
+        euclid = actor.los_shape == LOS_Shape.EUCLID
+        width, height = self.width, self.height
+        opaque_layer = self.opaque
+        new_start = start
+        for j in range(row, radius + 1):
+            dx, dy = -j - 1, -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                x = actor.x + dx * xx + dy * xy
+                y = actor.y + dx * yx + dy * yy
+                l_slope = (dx - 0.5) / (dy + 0.5)
+                r_slope = (dx + 0.5) / (dy - 0.5)
+                if start < r_slope:
+                    continue
+                elif end > l_slope:
+                    break
+                if 0 <= x < width and 0 <= y < height:
+                    if not euclid or dx * dx + dy * dy <= radius * radius:
+                        fov.add((x, y))
+                    opaque = opaque_layer[x * height + y]
+                else:
+                    opaque = True
+                if blocked:
+                    if opaque:
+                        new_start = r_slope
+                        continue
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque and j < radius:
+                    blocked = True
+                    self._cast_light(fov, actor, j + 1, start, l_slope,
+                                     xx, xy, yx, yy)
+                    new_start = r_slope
+            if blocked:
+                break
+
+    def raycast_fov(self, actor):
         """
         Adapted from http://ncase.me/sight-and-light/
         Notable changes: Instead of building a polygon from all possible
@@ -373,51 +1190,22 @@ class Map(Sequence):
         lines.append(self.line(actor.x, actor.y, actor.x + 1, actor.y + 1))
         """
 
-        wall_points = []
-        for room in self.rooms:
-            wall_points.extend(room.wall_points)
-
-        vision_boundary = RectRoom(actor.x - actor.radius,
-                                   actor.y - actor.radius,
-                                   actor.x + actor.radius,
-                                   actor.y + actor.radius)
-        lines = []
-        line = vision_boundary.wall_points
-        for point in line:
-            lines.append(self.line(actor.x, actor.y, point[0], point[1]))
+        wall_points = self.wall_index
+        opaque, height = self.opaque, self.height
 
+        # Rays go out to the square ring actor.radius tiles away. They're
+        # the same relative to the actor every time, so ray_table has them
+        # ready cut off at the radius, and all that's left is to stop each
+        # one at the first wall or closed door.
         polygon = []
-        for line in lines:
-            for step in line:
-                intersection = None
-                # No friggin need to repeatedly check the origin.
-                if (actor.x, actor.y) == step:
-                    continue
-                # Only for debugging purposes. Will probably just be square
-                # in the final game. Who knows, though? yolo
-                # Also, these math bits are weird. I don't know that I need
-                # them.
-                if actor.los_shape == LOS_Shape.EUCLID:
-                    distance = sqrt((step[0] - actor.x) ** 2
-                                    + (step[1] - actor.y) ** 2)
-                else:
-                    distance = max(abs(step[0] - actor.x),
-                                   abs(step[1] - actor.y))
-                if distance < actor.radius:
-                    if step in wall_points:
-                        if not self[step[0]][step[1]].check_door():
-                            intersection = step
-                        else:
-                            if self[step[0]][step[1]].prop.door_status:
-                                intersection = step
-                elif distance >= actor.radius:
-                    intersection = step
-                if not intersection:
-                    continue
-                break
-            if intersection:
-                if intersection not in polygon:
-                    polygon.append(intersection)
+        for ray in ray_table(actor.radius, actor.los_shape):
+            for dx, dy in ray:
+                x, y = actor.x + dx, actor.y + dy
+                if (x, y) in wall_points and opaque[x * height + y]:
+                    break
+            intersection = (x, y)
+            if intersection not in polygon:
+                polygon.append(intersection)
 
         def algo(point):
             nonlocal actor
@@ -440,12 +1228,18 @@ class Map(Sequence):
             for tile in line:
                 if tile not in poly_walls:
                     poly_walls.extend(line)
+        return self.fill_polygon(poly_walls)
 
+    def bounding_box(self, poly_walls):
         # bounding box: it's the enclosing box of possible tiles that need
         # to be checked for point-in-polygon. Probably a faster method,
         # but yolo.
-        bb = (min(poly_walls)[0], min(poly_walls, key=lambda x: x[1])[1],
-              max(poly_walls)[0], max(poly_walls, key=lambda x: x[1])[1])
+        return (min(poly_walls)[0], min(poly_walls, key=lambda x: x[1])[1],
+                max(poly_walls)[0], max(poly_walls, key=lambda x: x[1])[1])
+
+    def fill_polygon_python(self, poly_walls):
+        """The points of poly_walls plus everything point_in_poly says is in."""
+        bb = self.bounding_box(poly_walls)
         fov = []
         vertx, verty = zip(*poly_walls)
         for y in range(bb[1], bb[3] + 1):
@@ -455,8 +1249,43 @@ class Map(Sequence):
                     fov.append((x, y))
                 elif self.point_in_poly(x, y, vertx, verty):
                     fov.append((x, y))
-        actor.viewed_map.update(fov)
-        self.fov_map = fov
+        return fov
+
+    def fill_polygon_numpy(self, poly_walls):
+        """
+        fill_polygon_python for the whole bounding box at once. Each row
+        gets the x where every edge crosses it, worked out with the same
+        float operations as point_in_poly so the results match exactly,
+        and a point is in if an odd number of those lie to its right.
+        """
+        bb = self.bounding_box(poly_walls)
+        vertx = numpy.array([x for x, _ in poly_walls], dtype=numpy.float64)
+        verty = numpy.array([y for _, y in poly_walls], dtype=numpy.float64)
+        # Edge i runs from vertex i - 1 to vertex i, as in point_in_poly.
+        prevx, prevy = numpy.roll(vertx, 1), numpy.roll(verty, 1)
+        ys = numpy.arange(bb[1], bb[3] + 1, dtype=numpy.float64)[:, None]
+        xs = numpy.arange(bb[0], bb[2] + 1, dtype=numpy.float64)
+        crosses = (verty > ys) != (prevy > ys)
+        rise = numpy.where(verty == prevy, 1.0, prevy - verty)
+        crossing = (prevx - vertx) * (ys - verty) / rise + vertx
+        inside = ((xs[None, :, None] < crossing[:, None, :])
+                  & crosses[:, None, :]).sum(axis=2) & 1
+        fov = set(poly_walls)
+        rows, cols = numpy.nonzero(inside)
+        fov.update(zip((cols + bb[0]).tolist(), (rows + bb[1]).tolist()))
+        return fov
+
+    def fill_polygon(self, poly_walls):
+        """
+        fill_polygon_numpy whenever NumPy is around and the polygon is big
+        enough to be worth NumPy's fixed overhead.
+        """
+        if numpy is not None:
+            x0, y0, x1, y1 = self.bounding_box(poly_walls)
+            work = (x1 - x0 + 1) * (y1 - y0 + 1) * len(poly_walls)
+            if work >= NUMPY_FILL_MIN_WORK:
+                return self.fill_polygon_numpy(poly_walls)
+        return self.fill_polygon_python(poly_walls)
 
     def point_in_poly(self, x, y, vertx, verty):
         """
@@ -478,75 +1307,198 @@ class Map(Sequence):
             j = i
         return c
 
-    def generate_map(self, width, height, num_exits):
+    def index_room(self, room):
+        self.wall_index.update(room.wall_points)
+        for bucket in self._buckets(room.x_left, room.y_top,
+                                    room.x_right, room.y_bottom):
+            self.room_buckets.setdefault(bucket, []).append(room)
+
+    def _buckets(self, x0, y0, x1, y1):
+        for bx in range(x0 // ROOM_BUCKET_SIZE, x1 // ROOM_BUCKET_SIZE + 1):
+            for by in range(y0 // ROOM_BUCKET_SIZE,
+                            y1 // ROOM_BUCKET_SIZE + 1):
+                yield (bx, by)
+
+    def is_wall(self, x, y):
+        return (x, y) in self.wall_index
+
+    def rooms_in(self, x0, y0, x1, y1):
+        """
+        Rooms whose bounds overlap the inclusive rectangle (x0, y0)-(x1, y1),
+        in the order they were carved.
+        """
+        found = set()
+        for bucket in self._buckets(x0, y0, x1, y1):
+            for room in self.room_buckets.get(bucket, ()):
+                if room not in found and room.overlaps(x0, y0, x1, y1):
+                    found.add(room)
+        return [room for room in self.rooms if room in found]
+
+    def any_room_in(self, x0, y0, x1, y1):
+        """Whether rooms_in would find anything, without sorting it out."""
+        for bucket in self._buckets(x0, y0, x1, y1):
+            for room in self.room_buckets.get(bucket, ()):
+                if room.overlaps(x0, y0, x1, y1):
+                    return True
+        return False
+
+    def generate_map(self, width, height, num_exits, seed=None):
+        """
+        (Re)generate the map. Without a seed one is drawn from the global
+        random generator, so seeding that still reproduces everything.
+        """
+        start = perf_counter()
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.generation_stats = {'seed': seed}
+        self.revision += 1
+        self.fov_cache.clear()
+        self.tile_changes = []
         self.clear_map()
         self.generate_ground()
         self.carve_rooms()
         self.carve_passages()
         self.build_features()
+        self.generation_stats['seconds'] = perf_counter() - start
 
     def clear_map(self):
-        self.layout.clear()
+        self.chunks.clear()
+        self.chunk_store.clear()
+        self.palette.clear()
+        self.palette_codes.clear()
+        self.opaque = bytearray()
+        self.walkable = bytearray()
+        self.occupied = bytearray()
         self.rooms.clear()
+        self.wall_index.clear()
+        self.room_buckets.clear()
         self.passages.clear()
+        self.entities.clear()
+        self.entity_positions.clear()
+        self.entities_by_pos.clear()
         self.start_loc = None
 
     def generate_ground(self):
-        self.layout = [[Tile(x=x, y=y, glyph='.', color=COLOR['green'],
-                       bkcolor=COLOR['black'], physical=False)
-                       for y in range(self.height)]
-                       for x in range(self.width)]
-        self.fov = [[False for y in range(self.height)]
-                    for x in range(self.width)]
+        """
+        Lay down ground everywhere. No tiles are built here, only the
+        layers and the kinds chunks get painted with later.
+        """
+        self.ground = tile_kind(glyph='.', color=COLOR['green'],
+                                bkcolor=COLOR['black'], physical=False)
+        self.wall = self.ground.replace(glyph='#', color='grey',
+                                        physical=True)
+        self.floor = self.ground.replace(glyph='.', color='amber')
+        size = self.width * self.height
+        self.opaque = bytearray(size)
+        self.walkable = bytearray(b'\x01') * size
+        self.occupied = bytearray(size)
+        self.columns = [Column(self, x) for x in range(self.width)]
+
+    def fill_rect(self, x0, y0, x1, y1, opaque, walkable):
+        """
+        Set the opaque and walkable layers over the inclusive rectangle
+        (x0, y0)-(x1, y1), a column slice at a time, or a row at a time
+        (striding over the columns) when it's wider than it is tall.
+        """
+        height = self.height
+        columns, rows = x1 - x0 + 1, y1 - y0 + 1
+        if columns > rows:
+            opaque_run = bytes([opaque]) * columns
+            walkable_run = bytes([walkable]) * columns
+            stop = x1 * height + 1
+            for y in range(y0, y1 + 1):
+                start = x0 * height + y
+                self.opaque[start:stop + y:height] = opaque_run
+                self.walkable[start:stop + y:height] = walkable_run
+        else:
+            opaque_run = bytes([opaque]) * rows
+            walkable_run = bytes([walkable]) * rows
+            for x in range(x0, x1 + 1):
+                start = x * height + y0
+                self.opaque[start:start + rows] = opaque_run
+                self.walkable[start:start + rows] = walkable_run
+
+    def build_walls(self, room):
+        """Wall in room's outline, one fill per side."""
+        for x0, y0, x1, y1 in ((room.x_left, room.y_top,
+                                room.x_left, room.y_bottom),
+                               (room.x_right, room.y_top,
+                                room.x_right, room.y_bottom),
+                               (room.x_left, room.y_top,
+                                room.x_right, room.y_top),
+                               (room.x_left, room.y_bottom,
+                                room.x_right, room.y_bottom)):
+            self.fill_rect(x0, y0, x1, y1, opaque=True, walkable=False)
+
+    def build_door(self, x, y):
+        """A closed door at x, y, on what is assumed to be a room wall."""
+        if (x // CHUNK_SIZE, y // CHUNK_SIZE) in self.chunks:
+            self[x][y].build_door()
+            return
+        prop = Prop(x=x, y=y, glyph='+', color=COLOR['white'],
+                    physical=True, world=self)
+        prop.update(is_door=True, door_status=True)
+        self.add_entity(prop)
+        idx = x * self.height + y
+        self.opaque[idx] = True
+        self.walkable[idx] = True
 
     def carve_rooms(self):
-        cur_max = randint(self.min_rooms, self.max_rooms)
-        while len(self.rooms) < cur_max:
-            w, h = randint(2, 10), randint(2, 10)
-            x, y = randint(0, self.width - w), randint(0, self.height - h)
+        rng = self.rng
+        cur_max = rng.randint(self.min_rooms, self.max_rooms)
+        attempts = rejected = 0
+        while len(self.rooms) < cur_max and attempts < MAX_ROOM_ATTEMPTS:
+            attempts += 1
+            w, h = rng.randint(*ROOM_SIZE), rng.randint(*ROOM_SIZE)
+            x, y = rng.randint(0, self.width - w), rng.randint(0,
+                                                              self.height - h)
+            # Checked on the bare numbers, since a RectRoom works out all
+            # its wall points as soon as it's made.
+            if (x + w >= self.width or y + h >= self.height
+                    or self.any_room_in(x, y, x + w, y + h)):
+                rejected += 1
+                continue
             new_room = RectRoom(x, y, w, h)
-            failed = False
-            for other_room in self.rooms:
-                if new_room.intersect(other_room):
-                    failed = True
-                    break
-            if (new_room.x_right >= self.width) or (new_room.y_bottom >=
-                                                    self.height):
-                failed = True
-            if not failed:
-                self.rooms.append(new_room)
-                if not self.start_loc:
-                    self.start_loc = new_room.center()
-                for x, y in new_room.wall_points:
-                    self[x][y].update(glyph='#', color='grey', physical=True)
-                for y in range(new_room.y_top + 1, new_room.y_bottom):
-                    for x in range(new_room.x_left + 1, new_room.x_right):
-                        self[x][y].update(glyph='.', color='amber')
-        new_room = RectRoom(0, 0, self.width - 1, self.height - 1)
-        for x, y in new_room.wall_points:
-            self[x][y].update(glyph='#', color='grey', physical=True)
-        self.rooms.append(new_room)
+            self.rooms.append(new_room)
+            self.index_room(new_room)
+            if not self.start_loc:
+                self.start_loc = new_room.center()
+            self.build_walls(new_room)
+        self.generation_stats.update(rooms_wanted=cur_max,
+                                     rooms=len(self.rooms),
+                                     attempts=attempts,
+                                     rejected=rejected,
+                                     gave_up=len(self.rooms) < cur_max)
+        # The map's own outer wall. Its inside is left as ground.
+        self.bounds = RectRoom(0, 0, self.width - 1, self.height - 1)
+        self.build_walls(self.bounds)
+        self.rooms.append(self.bounds)
+        self.index_room(self.bounds)
 
     def carve_passages(self):
         pass
 
     def build_features(self):
+        rng = self.rng
         for idx, room in enumerate(self.rooms):
-            side = randint(0, 3)
+            side = rng.randint(0, 3)
             if side is 0:
-                x, y = (randrange(room.x_left + 1, room.x_right),
+                x, y = (rng.randrange(room.x_left + 1, room.x_right),
                         room.y_top)
             elif side is 1:
                 x, y = (room.x_left,
-                        randrange(room.y_top + 1, room.y_bottom))
+                        rng.randrange(room.y_top + 1, room.y_bottom))
             elif side is 2:
-                x, y = (randrange(room.x_left + 1, room.x_right),
+                x, y = (rng.randrange(room.x_left + 1, room.x_right),
                         room.y_bottom)
             elif side is 3:
                 x, y = (room.x_right,
-                        randrange(room.y_top + 1, room.y_bottom))
+                        rng.randrange(room.y_top + 1, room.y_bottom))
             if idx < len(self.rooms) - 1:
-                self[x][y].build_door()
+                self.build_door(x, y)
+        self.generation_stats['doors'] = len(self.rooms) - 1
 
 
 class RectRoom:
@@ -594,32 +1546,7 @@ class RectRoom:
 
     def line(self, x0, y0, x1, y1):
         """Bresenham's line algorithm"""
-        dx = abs(x1 - x0)
-        dy = abs(y1 - y0)
-        x, y = x0, y0
-        sx = -1 if x0 > x1 else 1
-        sy = -1 if y0 > y1 else 1
-        plot = []
-        if dx > dy:
-            err = dx / 2.0
-            while x != x1:
-                plot.append((x, y))
-                err -= dy
-                if err < 0:
-                    y += sy
-                    err += dx
-                x += sx
-        else:
-            err = dy / 2.0
-            while y != y1:
-                plot.append((x, y))
-                err -= dx
-                if err < 0:
-                    x += sx
-                    err += dy
-                y += sy
-        plot.append((x, y))
-        return plot
+        return [(x0 + dx, y0 + dy) for dx, dy in bresenham(x1 - x0, y1 - y0)]
 
     def center(self):
         x = (self.x_left + self.x_right) // 2
@@ -627,10 +1554,13 @@ class RectRoom:
         return (x, y)
 
     def intersect(self, other):
-        return (self.x_left <= other.x_right
-                and self.x_right >= other.x_left
-                and self.y_top <= other.y_bottom
-                and self.y_bottom >= other.y_top)
+        return self.overlaps(other.x_left, other.y_top,
+                             other.x_right, other.y_bottom)
+
+    def overlaps(self, x0, y0, x1, y1):
+        """intersect, against the inclusive rectangle (x0, y0)-(x1, y1)."""
+        return (self.x_left <= x1 and self.x_right >= x0
+                and self.y_top <= y1 and self.y_bottom >= y0)
 
 
 class RightAnglePassage:
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for viewport markup: how much memory and how many fresh
+strings one frame's worth of Tile.build_char costs, with the old per-frame
+str.format path next to the interned glyphs from intern_glyph.
+
+    python benchmarks/bench_markup.py
+"""
+import os
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Thing import Actor, Map, COLOR  # noqa: E402
+
+SCREEN_WIDTH = 58
+SCREEN_HEIGHT = 36
+FRAMES = 50
+
+
+def legacy_char(tile, fov_map):
+    """The markup path as it was before glyphs were interned in GLYPHS."""
+    within_fov = (tile.x, tile.y) in fov_map
+    thing = tile.occupied or tile.item or tile.prop
+    if thing:
+        bkcolor = "" if within_fov else "[bkcolor={}]".format(COLOR['grey'])
+        elements = [bkcolor, "[color={}]".format(thing.color), thing.glyph]
+    else:
+        bkcolor = tile.bkcolor if within_fov else COLOR['grey']
+        elements = ["[bkcolor={}]".format(bkcolor),
+                    "[color={}]".format(tile.color), tile.glyph]
+    return "".join(e for e in elements)
+
+
+def interned_char(tile, fov_map):
+    return tile.build_char(fov_map)
+
+
+def frame(world, pc, build):
+    chars = []
+    for column in world.window(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT):
+        for tile in column:
+            if (tile.x, tile.y) in pc.viewed_map:
+                chars.append(build(tile, world.fov_map))
+    return chars
+
+
+def measure(world, pc, build):
+    previous = {id(c) for c in frame(world, pc, build)}
+    fresh = 0
+    tracemalloc.start()
+    start = perf_counter()
+    for _ in range(FRAMES):
+        chars = frame(world, pc, build)
+        fresh += sum(1 for c in chars if id(c) not in previous)
+        previous = {id(c) for c in chars}
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'cells': len(chars),
+            'fresh_strings_per_frame': fresh / FRAMES,
+            'peak_bytes': peak,
+            'ms_per_frame': elapsed * 1000 / FRAMES}
+
+
+def main():
+    random.seed(7)
+    world = Map(name='debug', width=SCREEN_WIDTH, height=SCREEN_HEIGHT,
+                min_rooms=5, max_rooms=10, num_exits=2, level=None,
+                region='start')
+    pc = Actor(world, 'bench', *world.start_loc, '@', COLOR['white'], True)
+    pc.fog_toggle = False
+    pc.viewed_map.update((x, y) for x in range(world.width)
+                         for y in range(world.height))
+    world.calculate_fov(pc)
+    for name, build in (('format', legacy_char), ('interned', interned_char)):
+        result = measure(world, pc, build)
+        print("{:<9} cells={cells} fresh strings/frame={fresh_strings_per_frame:.0f}"
+              " peak bytes={peak_bytes} ms/frame={ms_per_frame:.3f}".format(
+                  name, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Memory benchmark for the tile store: how many bytes each tile costs and how
+long building every tile takes, on the levels from data/world.yaml and on a
+README-sized 325x325 quadrant.
+
+Maps only build tiles for the chunks somebody looks at, so every chunk is
+warmed here, with the chunk cache made big enough to hold the whole map.
+
+    python benchmarks/bench_memory.py
+"""
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Thing  # noqa: E402
+from Thing import Map, CHUNK_SIZE  # noqa: E402
+
+SIZES = (('debug', 58, 36), ('town', 70, 70), ('dungeon_1', 200, 200),
+         ('quadrant', 325, 325))
+
+
+def chunk_count(width, height):
+    return (-(-width // CHUNK_SIZE)) * (-(-height // CHUNK_SIZE))
+
+
+def measure(name, width, height):
+    random.seed(1)
+    cache_size = Thing.CHUNK_CACHE_SIZE
+    Thing.CHUNK_CACHE_SIZE = max(cache_size, chunk_count(width, height))
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        world = Map(name=name, width=width, height=height, min_rooms=5,
+                    max_rooms=10, num_exits=2, level=None, region='start')
+        world.warm(0, 0, width, height)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        world.chunks.clear()
+        start = perf_counter()
+        world.warm(0, 0, width, height)
+        elapsed = perf_counter() - start
+    finally:
+        Thing.CHUNK_CACHE_SIZE = cache_size
+    tiles = width * height
+    return {'tiles': tiles,
+            'bytes': after - before,
+            'bytes_per_tile': (after - before) / tiles,
+            'build_ms': elapsed * 1000}
+
+
+def main():
+    for name, width, height in SIZES:
+        result = measure(name, width, height)
+        print("{:<10} tiles={tiles:<7} bytes={bytes:<10} "
+              "bytes/tile={bytes_per_tile:.1f} build_tiles={build_ms:.1f}ms"
+              .format(name, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Benchmarks for the hot loops: map generation, saving and loading, FOV,
+rendering a frame on the headless terminal, and walking around. Everything
+is seeded so runs are comparable, and results come out as JSON.
+
+    python benchmarks/suite.py                    # print results
+    python benchmarks/suite.py --output out.json  # write them to a file
+    python benchmarks/suite.py --compare          # fail on regressions
+    python benchmarks/suite.py --save-baseline    # accept current numbers
+
+--compare checks against benchmarks/baseline.json and exits non-zero when
+any benchmark got slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Rendering has to run without a display.
+os.environ.setdefault('BEARLIBTERMINAL_BACKEND', 'headless')
+
+import content  # noqa: E402
+import rl  # noqa: E402
+from levels import LevelManager, build_level  # noqa: E402
+import savefile  # noqa: E402
+import Thing  # noqa: E402
+from Thing import Actor, LOS_Shape, FOV_Algo, COLOR  # noqa: E402
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+SEED = 1234
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def timed(func, repeat, min_sample=0.02):
+    """
+    Best wall time of one call to func, in seconds. Fast functions are
+    called in a loop until a sample takes at least min_sample, so the
+    timer's resolution doesn't swamp them.
+    """
+    loops = 1
+    while True:
+        start = perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = perf_counter() - start
+        if elapsed >= min_sample:
+            break
+        loops *= 10
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((perf_counter() - start) / loops)
+    return min(times)
+
+
+def load_levels():
+    return content.get().levels
+
+
+def build_map(level, seed):
+    return build_level(level, seed)
+
+
+def build_world(name, seed=SEED):
+    random.seed(seed)
+    world = build_map(load_levels()[name], seed)
+    pc = Actor(world, 'bench', *world.start_loc, '@', COLOR['white'], True)
+    return world, pc
+
+
+def open_ground(world, radius):
+    """The first walkable tile with nothing opaque within radius of it."""
+    height = world.height
+    for x in range(radius, world.width - radius):
+        for y in range(radius, height - radius):
+            if not world.walkable[x * height + y]:
+                continue
+            if not any(world.opaque[i * height + y - radius:
+                                    i * height + y + radius + 1].count(1)
+                       for i in range(x - radius, x + radius + 1)):
+                return x, y
+    raise ValueError("no open ground {} tiles across".format(radius))
+
+
+@benchmark
+def generate_map(results, repeat):
+    for name, level in load_levels().items():
+        results['generate_map.' + name] = timed(
+            lambda: build_map(level, SEED), repeat)
+    # A README-sized quadrant, well past any level in world.yaml.
+    quadrant = level._replace(name='quadrant', width=325, height=325,
+                              min_rooms=40, max_rooms=60)
+    results['generate_map.quadrant'] = timed(
+        lambda: build_map(quadrant, SEED), repeat)
+
+
+@benchmark
+def load_content(results, repeat):
+    cache_path = os.path.join(tempfile.mkdtemp(), content.CACHE_FILE)
+    results['content.parse'] = timed(content.parse, repeat)
+    content.load(cache_path=cache_path)
+    results['content.cached'] = timed(
+        lambda: content.load(cache_path=cache_path), repeat)
+    os.remove(cache_path)
+    os.rmdir(os.path.dirname(cache_path))
+
+
+@benchmark
+def save_load(results, repeat):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sav')
+    levels = load_levels()
+    quadrant = levels['dungeon_1']._replace(name='quadrant', width=325,
+                                            height=325, min_rooms=40,
+                                            max_rooms=60)
+    for name, level in (('dungeon_1', levels['dungeon_1']),
+                        ('quadrant', quadrant)):
+        world = build_map(level, SEED)
+        pc = Actor(world, 'bench', *world.start_loc, '@', COLOR['white'],
+                   True)
+        results['save.' + name] = timed(
+            lambda: savefile.save(path, world, pc), repeat)
+        results['load.' + name] = timed(lambda: savefile.load(path), repeat)
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+@benchmark
+def travel(results, repeat):
+    # Down to dungeon_1 and back up to town, with both levels kept in memory
+    # and with every trip evicting the level left behind to disk.
+    for name, cache_size in (('cached', 2), ('from_disk', 1)):
+        levels = LevelManager(load_levels(), seed=SEED, cache_size=cache_size,
+                              pregenerate=False)
+        world = levels.enter('town')
+        pc = Actor(world, 'bench', *world.start_loc, '@', COLOR['white'],
+                   True)
+        levels.travel(pc, 1)
+        levels.travel(pc, -1)
+
+        def round_trip():
+            levels.travel(pc, 1)
+            levels.travel(pc, -1)
+
+        results['travel.' + name] = timed(round_trip, repeat)
+        levels.close()
+
+
+@benchmark
+def regenerate(results, repeat):
+    # What R costs the frame it's pressed on, with the worker's map ready.
+    for name in ('dungeon_1', 'town'):
+        levels = LevelManager(load_levels(), seed=SEED)
+        world = levels.enter(name)
+        pc = Actor(world, 'bench', *world.start_loc, '@', COLOR['white'],
+                   True)
+        times = []
+        for _ in range(repeat * 4):
+            levels.upcoming[2].result()
+            start = perf_counter()
+            levels.regenerate(pc, wait=False)
+            times.append(perf_counter() - start)
+        results['regenerate.swap.' + name] = min(times)
+        levels.close()
+
+
+@benchmark
+def calculate_fov(results, repeat):
+    world, pc = build_world('town')
+    # Out in the open, so sight reaches the full radius and the radii
+    # actually cost different amounts.
+    world.unregister(pc)
+    pc.x, pc.y = open_ground(world, 16)
+    world.register(pc)
+
+    def uncached():
+        world.fov_cache.clear()
+        pc.fov_key = None
+        world.calculate_fov(pc)
+
+    for algo in FOV_Algo:
+        for shape in LOS_Shape:
+            for radius in (4, 8, 16):
+                pc.fov_algo, pc.los_shape, pc.radius = algo, shape, radius
+                name = 'calculate_fov.{}.{}.r{}'.format(
+                    algo.name.lower(), shape.name.lower(), radius)
+                results[name] = timed(uncached, repeat)
+    if Thing.numpy is not None:
+        # The pure-Python polygon fill NumPy replaces, for comparison.
+        world.fill_polygon = world.fill_polygon_python
+        pc.fov_algo = FOV_Algo.RAYCAST
+        for shape in LOS_Shape:
+            for radius in (4, 8, 16):
+                pc.los_shape, pc.radius = shape, radius
+                name = 'calculate_fov.raycast_python.{}.r{}'.format(
+                    shape.name.lower(), radius)
+                results[name] = timed(uncached, repeat)
+        del world.fill_polygon
+    pc.fov_algo, pc.los_shape, pc.radius = (FOV_Algo.SHADOWCAST,
+                                            LOS_Shape.SQUARE, 8)
+    world.calculate_fov(pc)
+    results['calculate_fov.cached'] = timed(
+        lambda: world.calculate_fov(pc), repeat)
+
+
+@benchmark
+def render(results, repeat):
+    terminal = rl.terminal
+    rl.initialize()
+    world, pc = build_world('town')
+    offset = rl.find_offset(world, pc, (0, 0))
+
+    def cold():
+        rl.viewport_cache.invalidate()
+        rl.ui_cache.clear()
+        rl.render(world, pc, offset)
+
+    results['render.full_frame'] = timed(cold, repeat)
+    rl.render(world, pc, offset)
+    results['render.idle_frame'] = timed(
+        lambda: rl.render(world, pc, offset), repeat)
+    terminal.close()
+
+
+@benchmark
+def walk(results, repeat):
+    steps = ((1, 0), (0, 1), (-1, 0), (0, -1),
+             (1, 1), (-1, 1), (-1, -1), (1, -1))
+
+    world, pc = build_world('dungeon_1')
+    rng = random.Random(SEED)
+
+    def stroll():
+        for step in range(500):
+            rl.move_actor(world, pc, rng.choice(steps))
+            if step % 10 == 0:
+                rl.try_door(world, pc)
+
+    results['walk.dungeon_1'] = timed(stroll, repeat)
+
+
+def run(repeat):
+    results = {}
+    for func in BENCHMARKS:
+        func(results, repeat)
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'seconds': results}
+
+
+def compare(current, baseline, tolerance):
+    """Names of benchmarks more than tolerance slower than the baseline."""
+    regressions = []
+    for name, seconds in sorted(current['seconds'].items()):
+        before = baseline['seconds'].get(name)
+        if before is None:
+            continue
+        ratio = seconds / before if before else float('inf')
+        marker = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            marker = '  <-- regression'
+        print("{:<40} {:>10.3e} {:>10.3e} {:>6.2f}x{}".format(
+            name, before, seconds, ratio, marker), file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results to this file')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--compare', action='store_true',
+                        help='compare against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    current = run(args.repeat)
+    text = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as out:
+            out.write(text + '\n')
+    if args.compare:
+        with open(args.baseline, 'r') as baseline_json:
+            baseline = json.load(baseline_json)
+        if compare(current, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
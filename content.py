@@ -0,0 +1,194 @@
+"""
+Game content from the YAML files under data/, parsed once.
+
+Each file's entries are checked against a schema and turned into frozen
+records: LevelDef for world.yaml, RaceDef for player.yaml and MonsterDef
+for monsters.yaml. Parsing uses libyaml's CSafeLoader when PyYAML was built
+with it. The records are then pickled to CACHE_FILE along with the mtime and
+hash of every source file. The next start only reads the pickle, as long as
+the sources haven't changed. A touched file with the same contents is
+recognised by its hash.
+
+    import content
+    levels = content.get().levels    # {'town': LevelDef(...), ...}
+
+get() also remembers what it loaded for the life of the process, so calling
+it from everywhere content is needed costs nothing after the first time.
+"""
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+
+import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CACHE_FILE = 'content.cache'
+# Bump when records or schemas change, so old caches get thrown away.
+CACHE_VERSION = 1
+
+LevelDef = namedtuple('LevelDef', 'name level region width height '
+                                  'min_rooms max_rooms num_exits')
+RaceDef = namedtuple('RaceDef', 'name char color physical max_health '
+                                'max_mana attack defense')
+MonsterDef = namedtuple('MonsterDef', 'name type x y z char color physical '
+                                      'invisible health mana attack defense')
+Content = namedtuple('Content', 'levels races monsters')
+
+# Source file, the Content field it fills, its record and each field's type.
+# A type of (int, None) means the field may be left empty.
+SCHEMAS = (
+    ('world.yaml', 'levels', LevelDef, {
+        'name': str, 'level': (int, None), 'region': str, 'width': int,
+        'height': int, 'min_rooms': int, 'max_rooms': int, 'num_exits': int}),
+    ('player.yaml', 'races', RaceDef, {
+        'name': str, 'char': str, 'color': str, 'physical': bool,
+        'max_health': int, 'max_mana': int, 'attack': int, 'defense': int}),
+    ('monsters.yaml', 'monsters', MonsterDef, {
+        'name': str, 'type': str, 'x': int, 'y': int, 'z': int, 'char': str,
+        'color': str, 'physical': bool, 'invisible': bool, 'health': int,
+        'mana': int, 'attack': int, 'defense': int}),
+    )
+
+_loaded = {}
+
+
+class ContentError(ValueError):
+    """A data file that doesn't match its schema."""
+
+
+def _check(value, kind):
+    if isinstance(kind, tuple):
+        return any(_check(value, option) for option in kind)
+    if kind is None:
+        return value is None
+    if kind is int:
+        # bool is an int, but a True where a number goes is a typo.
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, kind)
+
+
+def _kind_name(kind):
+    if isinstance(kind, tuple):
+        return ' or '.join(_kind_name(option) for option in kind)
+    return 'None' if kind is None else kind.__name__
+
+
+def compile_entries(filename, entries, record, fields):
+    """Validate a parsed file's entries into a dict of records."""
+    if not isinstance(entries, dict):
+        raise ContentError("{}: expected a mapping of entries, got {}"
+                           .format(filename, type(entries).__name__))
+    compiled = {}
+    for key, entry in entries.items():
+        where = "{}: {}".format(filename, key)
+        if not isinstance(entry, dict):
+            raise ContentError("{}: expected a mapping".format(where))
+        missing = [field for field in record._fields if field not in entry]
+        unknown = [field for field in entry if field not in fields]
+        if missing or unknown:
+            raise ContentError("{}: missing {}, unknown {}".format(
+                where, missing or 'nothing', unknown or 'nothing'))
+        values = {}
+        for field, kind in fields.items():
+            value = entry[field]
+            # world.yaml spells an empty field None, which YAML reads as a
+            # string.
+            if value == 'None' and _check(None, kind):
+                value = None
+            if not _check(value, kind):
+                raise ContentError("{}: {} should be {}, not {!r}".format(
+                    where, field, _kind_name(kind), value))
+            values[field] = value
+        compiled[key] = record(**values)
+    return compiled
+
+
+def parse(data_dir=DATA_DIR):
+    """Read and validate every content file, skipping any cache."""
+    compiled = {}
+    for filename, name, record, fields in SCHEMAS:
+        with open(os.path.join(data_dir, filename), 'rb') as source:
+            entries = yaml.load(source, Loader=SafeLoader)
+        compiled[name] = compile_entries(filename, entries, record, fields)
+    return Content(**compiled)
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _digest(path):
+    with open(path, 'rb') as source:
+        return hashlib.sha256(source.read()).hexdigest()
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'rb') as cache:
+            cached = pickle.load(cache)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError, TypeError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != CACHE_VERSION:
+        return None
+    return cached
+
+
+def _write_cache(cache_path, cached):
+    temp = cache_path + '.tmp'
+    try:
+        with open(temp, 'wb') as cache:
+            pickle.dump(cached, cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, cache_path)
+    except OSError:
+        # A read-only install just parses every time.
+        pass
+
+
+def load(data_dir=DATA_DIR, cache_path=None):
+    """
+    Content from data_dir, from the cache if every source file is unchanged,
+    otherwise parsed and cached again.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(data_dir, CACHE_FILE)
+    cached = _read_cache(cache_path)
+    sources = {}
+    fresh = cached is not None
+    stale_stamps = False
+    for filename, _, _, _ in SCHEMAS:
+        path = os.path.join(data_dir, filename)
+        stamp = _stamp(path)
+        known = cached['sources'].get(filename) if fresh else None
+        if known is not None and known['stamp'] == stamp:
+            sources[filename] = known
+            continue
+        digest = _digest(path)
+        sources[filename] = {'stamp': stamp, 'sha256': digest}
+        if known is not None and known['sha256'] == digest:
+            stale_stamps = True
+        else:
+            fresh = False
+    if fresh:
+        if stale_stamps:
+            cached['sources'] = sources
+            _write_cache(cache_path, cached)
+        return cached['content']
+    content = parse(data_dir)
+    _write_cache(cache_path, {'version': CACHE_VERSION, 'sources': sources,
+                              'content': content})
+    return content
+
+
+def get(data_dir=DATA_DIR):
+    """load, but only once per data_dir for the life of the process."""
+    content = _loaded.get(data_dir)
+    if content is None:
+        content = _loaded[data_dir] = load(data_dir)
+    return content
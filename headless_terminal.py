@@ -0,0 +1,409 @@
+"""
+A pure-Python stand-in for the BearLibTerminal shared library, for machines
+without a display (or without the binary at all). PyBearLibTerminal loads it
+in place of the real library when BEARLIBTERMINAL_BACKEND=headless is set:
+
+    BEARLIBTERMINAL_BACKEND=headless python rl.py
+
+Only the subset of the C API the game uses does anything interesting. Cells
+are kept in memory per layer, input comes from a script fed in with feed()
+or feed_at(), and once the script runs out a TK_CLOSE is delivered so game
+loops end on their own. calls counts every API call, which is what the
+benchmarks use to measure how chatty a frame is.
+"""
+from collections import Counter, deque
+
+# The handful of PyBearLibTerminal constants needed here. They can't be
+# imported, since this module is loaded while PyBearLibTerminal is still
+# being imported.
+TK_SHIFT = 0x70
+TK_CONTROL = 0x71
+TK_ALT = 0x72
+TK_KEY_RELEASED = 0x100
+TK_WIDTH = 0xC0
+TK_HEIGHT = 0xC1
+TK_CELL_WIDTH = 0xC2
+TK_CELL_HEIGHT = 0xC3
+TK_COLOR = 0xC4
+TK_BKCOLOR = 0xC5
+TK_LAYER = 0xC6
+TK_COMPOSITION = 0xC7
+TK_CHAR = 0xC8
+TK_WCHAR = 0xC9
+TK_EVENT = 0xCA
+TK_FULLSCREEN = 0xCB
+TK_CLOSE = 0xE0
+TK_INPUT_CANCELLED = -1
+
+# Rough equivalents of BearLibTerminal's built-in colour names. Exact values
+# don't matter headless, only that distinct names stay distinct.
+NAMED_COLORS = {
+    'black': 0xFF000000,
+    'white': 0xFFFFFFFF,
+    'grey': 0xFF808080,
+    'gray': 0xFF808080,
+    'red': 0xFFFF0000,
+    'flame': 0xFFFF4000,
+    'orange': 0xFFFF8000,
+    'amber': 0xFFFFBF00,
+    'yellow': 0xFFFFFF00,
+    'lime': 0xFFBFFF00,
+    'chartreuse': 0xFF80FF00,
+    'green': 0xFF00FF00,
+    'sea': 0xFF00FF80,
+    'turquoise': 0xFF00FFBF,
+    'cyan': 0xFF00FFFF,
+    'sky': 0xFF00BFFF,
+    'azure': 0xFF0080FF,
+    'blue': 0xFF0000FF,
+    'han': 0xFF4000FF,
+    'violet': 0xFF8000FF,
+    'purple': 0xFFBF00FF,
+    'fuchsia': 0xFFFF00FF,
+    'magenta': 0xFFFF00BF,
+    'pink': 0xFFFF0080,
+    'crimson': 0xFFFF0040,
+    }
+
+DEFAULT_COLOR = 0xFFFFFFFF
+DEFAULT_BKCOLOR = 0xFF000000
+
+calls = Counter()
+frames = []
+_state = {}
+_layers = {}
+_input = deque()
+_keys = set()
+
+
+def reset(width=80, height=25):
+    """Forget everything: cells, input, captured frames and call counts."""
+    calls.clear()
+    frames.clear()
+    _layers.clear()
+    _input.clear()
+    _keys.clear()
+    _state.clear()
+    _state.update({
+        TK_WIDTH: width,
+        TK_HEIGHT: height,
+        TK_CELL_WIDTH: 8,
+        TK_CELL_HEIGHT: 16,
+        TK_COLOR: DEFAULT_COLOR,
+        TK_BKCOLOR: DEFAULT_BKCOLOR,
+        TK_LAYER: 0,
+        TK_COMPOSITION: 0,
+        TK_EVENT: 0,
+        TK_CHAR: 0,
+        TK_WCHAR: 0,
+        TK_FULLSCREEN: 0,
+        })
+    _state['frame'] = 0
+    _state['capture'] = False
+    _state['auto_close'] = True
+    _state['closed'] = False
+
+
+reset()
+
+
+# Scripting and inspection
+
+def feed(*events):
+    """Queue input events to be delivered as soon as they are asked for."""
+    feed_at(_state['frame'], *events)
+
+
+def feed_at(frame, *events):
+    """Queue input events that only become visible once frame is reached."""
+    for event in events:
+        _input.append((frame, event))
+    _state['closed'] = False
+
+
+def capture(enabled=True):
+    """Keep a copy of the screen on every refresh, in frames."""
+    _state['capture'] = enabled
+
+
+def frame_count():
+    return _state['frame']
+
+
+def cell(x, y, layer=0):
+    """The (codepoint, color, bkcolor) at x, y on a layer, or None."""
+    return _layers.get(layer, {}).get((x, y))
+
+
+def screen_text():
+    """The visible screen as lines of text, upper layers winning."""
+    width, height = _state[TK_WIDTH], _state[TK_HEIGHT]
+    rows = [[' '] * width for _ in range(height)]
+    for layer in sorted(_layers):
+        for (x, y), (code, _, _) in _layers[layer].items():
+            if 0 <= x < width and 0 <= y < height:
+                rows[y][x] = chr(code)
+    return ["".join(row).rstrip() for row in rows]
+
+
+# The library API
+
+def terminal_open():
+    calls['open'] += 1
+    return 1
+
+
+def terminal_close():
+    calls['close'] += 1
+
+
+def terminal_set8(s):
+    calls['set'] += 1
+    for group in s.split(';'):
+        name, _, options = group.partition(':')
+        if name.strip() != 'window':
+            continue
+        for option in options.split(','):
+            key, _, value = option.partition('=')
+            if key.strip() == 'size':
+                width, _, height = value.strip().partition('x')
+                _state[TK_WIDTH], _state[TK_HEIGHT] = int(width), int(height)
+    return 1
+
+
+terminal_set16 = terminal_set32 = terminal_set8
+
+
+def terminal_refresh():
+    calls['refresh'] += 1
+    _state['frame'] += 1
+    if _state['capture']:
+        frames.append({layer: dict(cells) for layer, cells in _layers.items()})
+
+
+def terminal_clear():
+    calls['clear'] += 1
+    _layers.clear()
+
+
+def terminal_clear_area(x, y, w, h):
+    calls['clear_area'] += 1
+    cells = _layers.get(_state[TK_LAYER])
+    if not cells:
+        return
+    if w * h < len(cells):
+        for cx in range(x, x + w):
+            for cy in range(y, y + h):
+                cells.pop((cx, cy), None)
+    else:
+        for key in [k for k in cells
+                    if x <= k[0] < x + w and y <= k[1] < y + h]:
+            del cells[key]
+
+
+def terminal_crop(x, y, w, h):
+    calls['crop'] += 1
+
+
+def terminal_layer(layer):
+    calls['layer'] += 1
+    _state[TK_LAYER] = layer
+
+
+def terminal_color(color):
+    calls['color'] += 1
+    _state[TK_COLOR] = color & 0xFFFFFFFF
+
+
+def terminal_bkcolor(color):
+    calls['bkcolor'] += 1
+    _state[TK_BKCOLOR] = color & 0xFFFFFFFF
+
+
+def terminal_composition(mode):
+    calls['composition'] += 1
+    _state[TK_COMPOSITION] = mode
+
+
+def _put(x, y, code, color, bkcolor):
+    layer = _state[TK_LAYER]
+    if layer != 0:
+        # Only layer 0 has a background.
+        bkcolor = None
+    _layers.setdefault(layer, {})[(x, y)] = (code, color, bkcolor)
+
+
+def terminal_put(x, y, code):
+    calls['put'] += 1
+    _put(x, y, code, _state[TK_COLOR], _state[TK_BKCOLOR])
+
+
+def terminal_put_ext(x, y, dx, dy, code, corners):
+    calls['put_ext'] += 1
+    _put(x, y, code, _state[TK_COLOR], _state[TK_BKCOLOR])
+
+
+def terminal_pick(x, y, z):
+    calls['pick'] += 1
+    found = cell(x, y, _state[TK_LAYER])
+    return found[0] if found and z == 0 else 0
+
+
+def terminal_pick_color(x, y, z):
+    calls['pick_color'] += 1
+    found = cell(x, y, _state[TK_LAYER])
+    return found[1] if found and z == 0 else 0
+
+
+def terminal_pick_bkcolor(x, y):
+    calls['pick_bkcolor'] += 1
+    found = cell(x, y, 0)
+    return found[2] if found else 0
+
+
+def _parse(s):
+    """
+    Split markup into (char, color, bkcolor) runs, understanding [color],
+    [bkcolor], their closing tags and [[ / ]] escapes. Other tags, [+]
+    included, are skipped.
+    """
+    color, bkcolor = _state[TK_COLOR], _state[TK_BKCOLOR]
+    i = 0
+    while i < len(s):
+        ch = s[i]
+        if ch in '[]' and s[i + 1:i + 2] == ch:
+            yield ch, color, bkcolor
+            i += 2
+            continue
+        if ch == '[':
+            end = s.find(']', i)
+            if end < 0:
+                return
+            tag, _, value = s[i + 1:end].partition('=')
+            if tag == 'color':
+                color = _color_from_name(value)
+            elif tag == 'bkcolor':
+                bkcolor = _color_from_name(value)
+            elif tag == '/color':
+                color = _state[TK_COLOR]
+            elif tag == '/bkcolor':
+                bkcolor = _state[TK_BKCOLOR]
+            i = end + 1
+            continue
+        yield ch, color, bkcolor
+        i += 1
+
+
+def terminal_print8(x, y, s):
+    calls['print'] += 1
+    cx, longest = x, 0
+    for ch, color, bkcolor in _parse(s):
+        if ch == '\n':
+            longest = max(longest, cx - x)
+            cx, y = x, y + 1
+            continue
+        _put(cx, y, ord(ch), color, bkcolor)
+        cx += 1
+    return max(longest, cx - x)
+
+
+terminal_print16 = terminal_print32 = terminal_print8
+
+
+def terminal_measure8(s):
+    calls['measure'] += 1
+    return max(len("".join(ch for ch, _, _ in _parse(line)))
+               for line in s.split('\n'))
+
+
+terminal_measure16 = terminal_measure32 = terminal_measure8
+
+
+def _next_event():
+    if _input and _input[0][0] <= _state['frame']:
+        return _input[0][1]
+    if not _input and _state['auto_close'] and not _state['closed']:
+        return TK_CLOSE
+    return None
+
+
+def terminal_has_input():
+    calls['has_input'] += 1
+    return int(_next_event() is not None)
+
+
+def terminal_read():
+    calls['read'] += 1
+    event = _next_event()
+    if event is None:
+        # Nothing due yet; a real terminal would block, so skip ahead.
+        if not _input:
+            return TK_CLOSE
+        event = _input[0][1]
+    if _input:
+        _input.popleft()
+    elif event == TK_CLOSE:
+        # The script ran out; only say so once, like a real window would.
+        _state['closed'] = True
+    if event & TK_KEY_RELEASED:
+        _keys.discard(event & ~TK_KEY_RELEASED)
+    else:
+        _keys.add(event)
+    _state[TK_EVENT] = event
+    return event
+
+
+def terminal_peek():
+    calls['peek'] += 1
+    event = _next_event()
+    return 0 if event is None else event
+
+
+def terminal_state(code):
+    calls['state'] += 1
+    if code in _state:
+        return _state[code]
+    return int(code in _keys)
+
+
+def terminal_read_str8(x, y, buffer, max):
+    calls['read_str'] += 1
+    return TK_INPUT_CANCELLED
+
+
+terminal_read_str16 = terminal_read_str32 = terminal_read_str8
+
+
+def terminal_delay(period):
+    calls['delay'] += 1
+
+
+def terminal_get8(s, default_value):
+    calls['get'] += 1
+    return default_value
+
+
+terminal_get16 = terminal_get32 = terminal_get8
+
+
+def _color_from_name(name):
+    name = name.strip().lower()
+    if name.startswith('#') or len(name) in (6, 8):
+        digits = name.lstrip('#')
+        try:
+            value = int(digits, 16)
+        except ValueError:
+            pass
+        else:
+            if len(digits) <= 6:
+                value |= 0xFF000000
+            return value & 0xFFFFFFFF
+    return NAMED_COLORS.get(name, DEFAULT_COLOR)
+
+
+def color_from_name8(name):
+    calls['color_from_name'] += 1
+    return _color_from_name(name)
+
+
+color_from_name16 = color_from_name32 = color_from_name8
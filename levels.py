@@ -0,0 +1,296 @@
+"""
+Levels from data/world.yaml, kept around between visits.
+
+LevelManager hands out a Map per level. The last few levels visited stay in
+memory; older ones are written out with savefile and read back when they're
+wanted again, so however many levels a run goes through only cache_size of
+them are ever held at once. While the player is on one level, the levels a
+step up and down (by their `level` number) are generated on a worker thread,
+so taking the stairs doesn't wait for generation. So is the next map for the
+level the player is on, ready for when they ask for a new one.
+
+With processes set, the work goes to a process pool instead, out of reach of
+the GIL altogether. Maps come back from it as savefile bytes.
+
+Every level's seed comes from the manager's seed, the level's name and how
+many times it has been regenerated, so a run is the same whatever order
+levels get generated in.
+"""
+import os
+import random
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import content
+import savefile
+from Thing import Map, TileSet
+
+# How many levels are kept in memory, the one the player is on included.
+LEVEL_CACHE_SIZE = 3
+
+
+def build_level(settings, seed=None):
+    """A Map for one level's content.LevelDef."""
+    return Map(name=settings.name, width=settings.width,
+               height=settings.height, min_rooms=settings.min_rooms,
+               max_rooms=settings.max_rooms, num_exits=settings.num_exits,
+               level=settings.level, region=settings.region, seed=seed)
+
+
+def build_level_data(settings, seed=None):
+    """build_level for a process pool, with the map sent back as bytes."""
+    return savefile.dumps(build_level(settings, seed))
+
+
+class LevelManager:
+    def __init__(self, levels, seed=None, cache_size=LEVEL_CACHE_SIZE,
+                 directory=None, pregenerate=True, processes=False):
+        # content.LevelDefs by key.
+        self.levels = levels
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.cache_size = max(cache_size, 1)
+        self.cache = OrderedDict()
+        # Futures of pre-generated levels nobody has gone to yet.
+        self.pending = {}
+        # Evicted levels, by key, and what the player had seen of them.
+        self.saved = {}
+        self.explored = {}
+        # How many times each level has been regenerated, and the
+        # (key, generation, future) of the next map for the current level.
+        self.generations = {}
+        self.upcoming = None
+        self.directory = directory
+        self.own_directory = directory is None
+        self.processes = processes
+        self.executor = None
+        if pregenerate:
+            self.executor = (ProcessPoolExecutor(max_workers=1) if processes
+                             else ThreadPoolExecutor(max_workers=1))
+        self.current = None
+
+    @classmethod
+    def from_content(cls, loaded=None, **kwargs):
+        """A manager for the levels in loaded, by default content.get()."""
+        if loaded is None:
+            loaded = content.get()
+        return cls(loaded.levels, **kwargs)
+
+    def level_seed(self, key, generation=0):
+        name = '{}:{}'.format(self.seed, key)
+        if generation:
+            name = '{}:{}'.format(name, generation)
+        return random.Random(name).getrandbits(32)
+
+    def submit(self, key, generation=0):
+        """
+        Start building a level on the worker. It's seeded here, not there,
+        so the result doesn't depend on timing.
+        """
+        build = build_level_data if self.processes else build_level
+        return self.executor.submit(build, self.levels[key],
+                                    self.level_seed(key, generation))
+
+    def finish(self, future):
+        """The Map a future from submit comes up with."""
+        result = future.result()
+        if self.processes:
+            result, _ = savefile.loads(result)
+        return result
+
+    def depth(self, key):
+        """The level's number, or None for levels outside the stairs."""
+        return self.levels[key].level
+
+    def neighbour(self, key, step):
+        """The level step levels below key (above, if negative), or None."""
+        depth = self.depth(key)
+        if depth is None:
+            return None
+        for other in self.levels:
+            if self.depth(other) == depth + step:
+                return other
+        return None
+
+    def get(self, key):
+        """
+        The Map for level key, from memory, from disk, from the worker, or
+        generated on the spot, in that order of preference.
+        """
+        world = self.cache.get(key)
+        if world is not None:
+            self.cache.move_to_end(key)
+            return world
+        if key in self.pending:
+            world = self.finish(self.pending.pop(key))
+        elif key in self.saved:
+            path = self.saved.pop(key)
+            world, _ = savefile.load(path)
+            os.remove(path)
+            seen = path + '.seen'
+            if os.path.exists(seen):
+                with open(seen, 'rb') as seen_file:
+                    explored = TileSet(world.width, world.height)
+                    explored.bits = bytearray(seen_file.read())
+                    self.explored[key] = explored
+                os.remove(seen)
+        else:
+            world = build_level(self.levels[key], self.level_seed(
+                key, self.generations.get(key, 0)))
+        self.cache[key] = world
+        while len(self.cache) > self.cache_size:
+            self.evict()
+        return world
+
+    def evict(self):
+        """Write the least recently used level out to disk."""
+        key, world = self.cache.popitem(last=False)
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='levels-')
+        path = os.path.join(self.directory, '{}.sav'.format(key))
+        savefile.save(path, world)
+        explored = self.explored.pop(key, None)
+        if explored is not None:
+            with open(path + '.seen', 'wb') as seen_file:
+                seen_file.write(explored.bits)
+        self.saved[key] = path
+
+    def pregenerate(self, *keys):
+        """Start generating levels that aren't around yet on the worker."""
+        if self.executor is None:
+            return
+        for key in keys:
+            if (key is None or key in self.cache or key in self.pending
+                    or key in self.saved):
+                continue
+            self.pending[key] = self.submit(key,
+                                            self.generations.get(key, 0))
+
+    def enter(self, key, pc=None):
+        """
+        Make key the current level and move pc onto it, at its start. pc
+        keeps what it saw of every level it has been on. Returns the Map.
+        """
+        moving = pc is not None and key != self.current
+        if moving and pc.world is not None:
+            # Off the old level before anything can evict it, so it never
+            # gets saved with pc still on it.
+            pc.world.unregister(pc)
+            if self.current is not None:
+                self.explored[self.current] = pc.viewed_map
+        world = self.get(key)
+        if moving:
+            self.place(pc, world, self.explored.pop(key, None))
+        self.arrive(key)
+        return world
+
+    def place(self, pc, world, explored=None):
+        """Put pc at world's start, remembering explored of it."""
+        # Entity IDs are per map, and so is the FOV pc last worked out,
+        # though its key doesn't say which map it was for.
+        pc._entity_id = None
+        pc.fov_key = None
+        pc.world = world
+        pc.place(world.start_loc)
+        world.register(pc)
+        if explored is None:
+            explored = TileSet(world.width, world.height)
+        pc.viewed_map = explored
+
+    def arrive(self, key):
+        """Make key current and get its neighbours ready."""
+        self.current = key
+        neighbours = (self.neighbour(key, 1), self.neighbour(key, -1))
+        # Anything pre-generated for somewhere else is dropped; being
+        # seeded, it comes out the same if it's ever needed.
+        for other in list(self.pending):
+            if other not in neighbours:
+                self.pending.pop(other).cancel()
+        self.pregenerate(*neighbours)
+        self.prepare()
+
+    def prepare(self):
+        """Start on the next map for the current level, if it isn't yet."""
+        if self.executor is None:
+            return
+        key = self.current
+        generation = self.generations.get(key, 0) + 1
+        if self.upcoming is not None:
+            if self.upcoming[:2] == (key, generation):
+                return
+            self.upcoming[2].cancel()
+        self.upcoming = (key, generation, self.submit(key, generation))
+
+    def regenerate(self, pc=None, wait=True):
+        """
+        Swap the current level for a new map, the next in its line of
+        seeds, with pc moved onto it. Normally that map was built on the
+        worker while the old one was played; if it's still being built
+        and wait isn't set, nothing changes and None comes back, so the
+        caller can try again next frame. Returns the new Map.
+        """
+        key = self.current
+        generation = self.generations.get(key, 0) + 1
+        if (self.upcoming is not None
+                and self.upcoming[:2] == (key, generation)):
+            future = self.upcoming[2]
+            if not wait and not future.done():
+                return None
+            world = self.finish(future)
+            self.upcoming = None
+        else:
+            world = build_level(self.levels[key],
+                                self.level_seed(key, generation))
+        # The swap: nothing else sees the new map until this point.
+        self.generations[key] = generation
+        old = self.cache.get(key)
+        if pc is not None and old is not None and pc.world is old:
+            old.unregister(pc)
+        self.cache[key] = world
+        self.cache.move_to_end(key)
+        self.explored.pop(key, None)
+        if pc is not None:
+            self.place(pc, world)
+        self.prepare()
+        return world
+
+    def restore(self, world):
+        """
+        Put a loaded map in place of the level it was saved from, and make
+        that the current level. Returns its key.
+        """
+        key = next(key for key, settings in self.levels.items()
+                   if settings.name == world.name)
+        if key in self.pending:
+            self.pending.pop(key).cancel()
+        path = self.saved.pop(key, None)
+        if path is not None:
+            os.remove(path)
+            if os.path.exists(path + '.seen'):
+                os.remove(path + '.seen')
+        self.explored.pop(key, None)
+        self.cache[key] = world
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.evict()
+        self.arrive(key)
+        return key
+
+    def travel(self, pc, step):
+        """
+        Take pc step levels down (up, if negative) from the current level.
+        Returns the new Map, or None if there's no level that way.
+        """
+        key = self.neighbour(self.current, step)
+        if key is None:
+            return None
+        return self.enter(key, pc)
+
+    def close(self):
+        self.upcoming = None
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        if self.own_directory and self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.saved.clear()
@@ -0,0 +1,223 @@
+"""
+Generate lots of seeded maps for a world.yaml level, without the game, and
+report on each of them. Handy for tuning generation.
+
+    python mapgen.py dungeon_1 -n 1000                  # JSONL to stdout
+    python mapgen.py dungeon_1 -n 1000 --output stats.jsonl
+    python mapgen.py town -n 50 --seed 100 --dump maps/ # keep the maps too
+    python mapgen.py dungeon_1 --max-rooms 40 --room-size 3 12
+
+Map i gets seed --seed + i, so any line can be made again with
+Map(..., seed=seed), or looked at with savefile.load if --dump was given.
+Maps are spread over --jobs processes, every core by default. Lines come out
+in seed order as soon as each map is done, and a summary goes to stderr at
+the end.
+
+Each line has the map's seed and size, and:
+
+    rooms, rooms_wanted    rooms carved (not counting the outer wall),
+                           and how many carve_rooms was going for
+    attempts, rejected     placements tried, and how many overlapped or
+                           didn't fit
+    gave_up                whether MAX_ROOM_ATTEMPTS ran out first
+    doors                  doors built
+    floor_coverage         share of the map that's room floor
+    walkable, reachable    walkable tiles, and how many of them can be
+                           walked to from the start (doors count as open)
+    seconds                generation time
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from time import perf_counter
+
+import content
+import savefile
+import Thing
+from levels import build_level
+
+
+def reachable(world):
+    """How many walkable tiles can be walked to from world.start_loc."""
+    if world.start_loc is None:
+        return 0
+    # A padded copy of the walkable layer, so every column starts and ends
+    # blocked and the fill never needs bounds checks.
+    height = world.height
+    stride = height + 2
+    open_tiles = bytearray((world.width + 2) * stride)
+    for x in range(world.width):
+        start = (x + 1) * stride + 1
+        open_tiles[start:start + height] = world.walkable[
+            x * height:(x + 1) * height]
+    # Scanline fill down the columns: each step clears a whole run of open
+    # tiles in one go, then queues the runs it touches in the columns
+    # either side, diagonals included.
+    x, y = world.start_loc
+    stack = [(x + 1, y + 1)]
+    count = 0
+    while stack:
+        x, y = stack.pop()
+        column = x * stride
+        if not open_tiles[column + y]:
+            continue
+        top = open_tiles.rfind(0, column, column + y) + 1
+        bottom = open_tiles.find(0, column + y, column + stride)
+        open_tiles[top:bottom] = bytes(bottom - top)
+        count += bottom - top
+        for side in (column - stride, column + stride):
+            # Rows top - 1 to bottom, in the neighbouring column.
+            at = side + top - column - 1
+            end = side + bottom - column + 1
+            while True:
+                at = open_tiles.find(1, at, end)
+                if at < 0:
+                    break
+                stack.append((side // stride, at - side))
+                at = open_tiles.find(0, at, side + stride)
+    return count
+
+
+def survey(world):
+    """The stats line for a freshly generated world."""
+    stats = world.generation_stats
+    floor = sum((room.x_right - room.x_left - 1)
+                * (room.y_bottom - room.y_top - 1)
+                for room in world.rooms if room is not world.bounds)
+    return {
+        'seed': world.seed,
+        'width': world.width,
+        'height': world.height,
+        'rooms': stats['rooms'],
+        'rooms_wanted': stats['rooms_wanted'],
+        'attempts': stats['attempts'],
+        'rejected': stats['rejected'],
+        'gave_up': stats['gave_up'],
+        'doors': stats['doors'],
+        'floor_coverage': floor / (world.width * world.height),
+        'walkable': world.walkable.count(1),
+        'reachable': reachable(world),
+        'seconds': stats['seconds'],
+        }
+
+
+def generate(job):
+    """Build and survey one map. Runs on the pool's workers."""
+    level, settings, seed, dump = job
+    world = build_level(settings, seed)
+    line = survey(world)
+    line['level'] = level
+    if dump is not None:
+        path = os.path.join(dump, '{}-{}.sav'.format(level, seed))
+        savefile.save(path, world)
+        line['dump'] = path
+    return line
+
+
+def configure(room_size):
+    """Pool initializer, so the workers carve rooms the same way."""
+    if room_size is not None:
+        Thing.ROOM_SIZE = tuple(room_size)
+
+
+SUMMED = ('rooms', 'rejected', 'doors', 'floor_coverage', 'reachable',
+          'seconds', 'gave_up')
+
+
+def write_lines(results, out):
+    """Stream results to out as JSONL. Returns the totals of SUMMED."""
+    totals = dict.fromkeys(SUMMED, 0)
+    totals['count'] = 0
+    for line in results:
+        out.write(json.dumps(line, sort_keys=True) + '\n')
+        out.flush()
+        for key in SUMMED:
+            totals[key] += line[key]
+        totals['count'] += 1
+    return totals
+
+
+def summarize(totals, elapsed, out):
+    count = totals['count']
+    if not count:
+        return
+    mean = {key: totals[key] / count for key in SUMMED}
+    print("{} maps in {:.2f}s ({:.1f}/s); mean rooms {rooms:.1f}, "
+          "rejected {rejected:.1f}, doors {doors:.1f}, floor "
+          "{floor_coverage:.1%}, reachable {reachable:.0f}, generation "
+          "{seconds:.4f}s; {} gave up".format(
+              count, elapsed, count / elapsed if elapsed else 0,
+              totals['gave_up'], **{key: value for key, value in mean.items()
+                                    if key != 'gave_up'}),
+          file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('level', help='a level from data/world.yaml')
+    parser.add_argument('-n', '--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first map; the rest count up')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes (default: every core)')
+    parser.add_argument('--output', help='write JSONL here, not stdout')
+    parser.add_argument('--dump', metavar='DIR',
+                        help='also save every map here, in savefile format')
+    parser.add_argument('--width', type=int)
+    parser.add_argument('--height', type=int)
+    parser.add_argument('--min-rooms', type=int)
+    parser.add_argument('--max-rooms', type=int)
+    parser.add_argument('--room-size', type=int, nargs=2,
+                        metavar=('MIN', 'MAX'),
+                        help='range of room sizes (default: {} {})'.format(
+                            *Thing.ROOM_SIZE))
+    args = parser.parse_args(argv)
+    if args.room_size is not None:
+        low, high = args.room_size
+        if not 2 <= low <= high:
+            parser.error("--room-size needs 2 <= MIN <= MAX, got {} {}"
+                         .format(low, high))
+
+    levels = content.get().levels
+    if args.level not in levels:
+        parser.error("no level {!r} in world.yaml (there's {})".format(
+            args.level, ', '.join(sorted(levels))))
+    overrides = {field: getattr(args, field) for field in
+                 ('width', 'height', 'min_rooms', 'max_rooms')
+                 if getattr(args, field) is not None}
+    settings = levels[args.level]._replace(**overrides)
+    # A room as wide as the map never fits, and any wider breaks carving.
+    largest = (args.room_size or Thing.ROOM_SIZE)[1]
+    if largest >= min(settings.width, settings.height):
+        parser.error("rooms up to {} across don't fit a {}x{} map; give a "
+                     "smaller --room-size MAX".format(
+                         largest, settings.width, settings.height))
+    if args.dump is not None:
+        os.makedirs(args.dump, exist_ok=True)
+    jobs = ((args.level, settings, args.seed + i, args.dump)
+            for i in range(args.count))
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start = perf_counter()
+    try:
+        if args.jobs is None or args.jobs <= 1:
+            configure(args.room_size)
+            totals = write_lines(map(generate, jobs), out)
+        else:
+            with multiprocessing.Pool(args.jobs, initializer=configure,
+                                      initargs=(args.room_size,)) as pool:
+                # Chunks small enough that lines keep trickling out.
+                chunksize = max(1, min(32, args.count // (args.jobs * 8)))
+                totals = write_lines(pool.imap(generate, jobs, chunksize),
+                                     out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    summarize(totals, perf_counter() - start, sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Pathfinding over a Map's dense layers.
+
+Pathfinder answers one-off A* queries and keeps its search buffers between
+them. FlowField is a Dijkstra map: the distance from every tile to the
+nearest goal, so any number of monsters can walk downhill toward the player
+off one shared field. Both follow the map's tile change log, so toggling a
+door only repairs the part of a field that actually ran through it.
+
+Grids here are padded with a blocked border one tile wide, so neighbours can
+be found by adding an offset to an index without any bounds checks.
+"""
+from heapq import heappush, heappop
+
+# The eight steps an actor can take, in the order Actor.adjacent used.
+NEIGHBORS = ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+             (0, 1), (1, -1), (1, 0), (1, 1))
+# Extra cost of stepping into a closed door, since opening it takes a turn.
+DOOR_COST = 1
+UNREACHED = 1 << 30
+
+
+class _Grid:
+    """Step costs for a map, 0 meaning blocked, kept in step with the map."""
+    def __init__(self, world, door_cost=DOOR_COST):
+        self.world = world
+        self.door_cost = door_cost
+        self.rebuild()
+
+    def rebuild(self):
+        world = self.world
+        self.stride = stride = world.height + 2
+        self.size = (world.width + 2) * stride
+        self.offsets = tuple(dx * stride + dy for dx, dy in NEIGHBORS)
+        self.costs = costs = bytearray(self.size)
+        for x in range(world.width):
+            base = x * world.height
+            row = (x + 1) * stride + 1
+            for y in range(world.height):
+                costs[row + y] = self.tile_cost(base + y)
+        self.log = world.tile_changes
+        self.seen = len(self.log)
+
+    def tile_cost(self, idx):
+        world = self.world
+        if not world.walkable[idx]:
+            return 0
+        # Walkable and opaque is a closed door.
+        return 1 + self.door_cost * world.opaque[idx]
+
+    def pad(self, x, y):
+        return (x + 1) * self.stride + y + 1
+
+    def unpad(self, p):
+        x, y = divmod(p, self.stride)
+        return x - 1, y - 1
+
+    def refresh(self):
+        """
+        Catch up with the map. Returns the (index, old cost) of every tile
+        whose cost changed, or None if the map was regenerated and
+        everything has to be worked out again.
+        """
+        world = self.world
+        if world.tile_changes is not self.log:
+            self.rebuild()
+            return None
+        if self.seen == len(self.log):
+            return []
+        changed = set(self.log[self.seen:])
+        self.seen = len(self.log)
+        costs = self.costs
+        updates = []
+        for idx in changed:
+            x, y = divmod(idx, world.height)
+            p = self.pad(x, y)
+            cost = self.tile_cost(idx)
+            if cost != costs[p]:
+                updates.append((p, costs[p]))
+                costs[p] = cost
+        return updates
+
+
+class Pathfinder(_Grid):
+    """
+    A* over a map. The search buffers are allocated once and stamped with a
+    generation number per search, so a query never has to clear them.
+    """
+    def rebuild(self):
+        super().rebuild()
+        self.generation = 0
+        self.stamp = [0] * self.size
+        self.g = [0] * self.size
+        self.came_from = [0] * self.size
+
+    def find_path(self, start, goal, through_actors=True, max_nodes=None):
+        """
+        The cheapest path from start to goal, as a list of (x, y) with start
+        left out, or None if there isn't one. Unless through_actors is set,
+        occupied tiles other than the goal count as blocked. max_nodes caps
+        how many tiles get expanded before giving up.
+        """
+        self.refresh()
+        costs, offsets, stride = self.costs, self.offsets, self.stride
+        s = self.pad(*start)
+        t = self.pad(*goal)
+        if not costs[t]:
+            return None
+        self.generation += 1
+        generation = self.generation
+        stamp, g, came_from = self.stamp, self.g, self.came_from
+        occupied, height = self.world.occupied, self.world.height
+        gx, gy = divmod(t, stride)
+
+        stamp[s] = generation
+        g[s] = 0
+        frontier = [(0, 0, s)]
+        expanded = 0
+        while frontier:
+            _, cost, p = heappop(frontier)
+            if p == t:
+                path = []
+                while p != s:
+                    path.append(self.unpad(p))
+                    p = came_from[p]
+                path.reverse()
+                return path
+            if cost > g[p]:
+                continue
+            expanded += 1
+            if max_nodes is not None and expanded > max_nodes:
+                return None
+            for offset in offsets:
+                n = p + offset
+                step = costs[n]
+                if not step:
+                    continue
+                if not through_actors and n != t:
+                    nx, ny = divmod(n, stride)
+                    if occupied[(nx - 1) * height + ny - 1]:
+                        continue
+                new_cost = cost + step
+                if stamp[n] != generation or new_cost < g[n]:
+                    stamp[n] = generation
+                    g[n] = new_cost
+                    came_from[n] = p
+                    nx, ny = divmod(n, stride)
+                    h = max(abs(nx - gx), abs(ny - gy))
+                    heappush(frontier, (new_cost + h, new_cost, n))
+        return None
+
+
+class FlowField(_Grid):
+    """
+    A Dijkstra map toward one or more goals. Call update once a turn with
+    wherever the goals are now; monsters then ask step for which way to go.
+    Past max_distance nothing is worked out, which keeps a field around the
+    player cheap on a big map.
+    """
+    def __init__(self, world, max_distance=None, door_cost=DOOR_COST):
+        self.max_distance = UNREACHED if max_distance is None else max_distance
+        self.goals = ()
+        super().__init__(world, door_cost)
+
+    def rebuild(self):
+        super().rebuild()
+        self.dist = [UNREACHED] * self.size
+
+    def update(self, *goals):
+        """
+        Point the field at goals, (x, y) each, doing as little work as it
+        can. Returns True if anything changed.
+        """
+        goals = tuple(self.pad(x, y) for x, y in goals)
+        changed = self.refresh()
+        if changed is None or goals != self.goals:
+            self.goals = goals
+            self.recompute()
+            return True
+        if changed:
+            self.repair(changed)
+            return True
+        return False
+
+    def recompute(self):
+        dist = self.dist = [UNREACHED] * self.size
+        frontier = []
+        for p in self.goals:
+            dist[p] = 0
+            frontier.append((0, p))
+        self._propagate(frontier)
+
+    def _propagate(self, frontier):
+        dist, costs, offsets = self.dist, self.costs, self.offsets
+        limit = self.max_distance
+        while frontier:
+            d, p = heappop(frontier)
+            if d > dist[p]:
+                continue
+            # Stepping from a neighbour into p costs p's cost.
+            nd = d + costs[p]
+            if nd > limit:
+                continue
+            for offset in offsets:
+                n = p + offset
+                if costs[n] and nd < dist[n]:
+                    dist[n] = nd
+                    heappush(frontier, (nd, n))
+
+    def repair(self, changed):
+        """Fix up the field after the tiles in changed changed cost."""
+        dist, costs, offsets = self.dist, self.costs, self.offsets
+        goals = self.goals
+        # Anything whose distance ran through a tile that got dearer, or
+        # blocked, is forgotten and found again from its neighbours.
+        stack = []
+        seeds = set()
+        for p, old in changed:
+            new = costs[p]
+            seeds.add(p)
+            seeds.update(p + offset for offset in offsets)
+            if old and (not new or new > old) and dist[p] < UNREACHED:
+                via = dist[p] + old
+                stack.extend(p + offset for offset in offsets
+                             if dist[p + offset] == via)
+            if not new and p not in goals:
+                dist[p] = UNREACHED
+        while stack:
+            c = stack.pop()
+            d = dist[c]
+            if d >= UNREACHED or c in goals:
+                continue
+            dist[c] = UNREACHED
+            seeds.add(c)
+            via = d + costs[c]
+            for offset in offsets:
+                n = c + offset
+                if dist[n] == via:
+                    stack.append(n)
+                seeds.add(n)
+
+        limit = self.max_distance
+        frontier = []
+        for c in seeds:
+            if not costs[c] or c in goals:
+                continue
+            best = dist[c]
+            for offset in offsets:
+                m = c + offset
+                if dist[m] < UNREACHED and costs[m]:
+                    nd = dist[m] + costs[m]
+                    if nd < best and nd <= limit:
+                        best = nd
+            if best < dist[c]:
+                dist[c] = best
+            if best < UNREACHED:
+                heappush(frontier, (best, c))
+        self._propagate(frontier)
+
+    def distance(self, x, y):
+        """How far x, y is from the nearest goal, or None if out of reach."""
+        d = self.dist[self.pad(x, y)]
+        return None if d >= UNREACHED else d
+
+    def step(self, x, y, avoid_occupied=True):
+        """
+        Which way, as (dx, dy), to go from x, y to get closer to a goal, or
+        None if there's no way closer. Occupied tiles are stepped around,
+        unless they're a goal.
+        """
+        dist, costs = self.dist, self.costs
+        p = self.pad(x, y)
+        best, best_step = dist[p], None
+        occupied, height = self.world.occupied, self.world.height
+        for (dx, dy), offset in zip(NEIGHBORS, self.offsets):
+            n = p + offset
+            if dist[n] >= best or not costs[n]:
+                continue
+            if (avoid_occupied and n not in self.goals
+                    and occupied[(x + dx) * height + y + dy]):
+                continue
+            best, best_step = dist[n], (dx, dy)
+        return best_step
+
+
+def chaser(field):
+    """An Actor.ai that walks its actor one step down field per turn."""
+    def ai(actor, world):
+        step = field.step(actor.x, actor.y)
+        if step is None:
+            # Boxed in by other actors, wait; out of reach, sleep.
+            return None if field.distance(actor.x, actor.y) is None else 1
+        actor.move(world, *step)
+        return 1
+    return ai
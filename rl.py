@@ -1,6 +1,10 @@
-import yaml
 import PyBearLibTerminal as terminal
-from Thing import Actor, Map, Game_States, COLOR
+from Thing import Actor, Game_States, COLOR, CHUNK_SIZE, TileSet
+from scheduler import Scheduler
+from pathfinding import FlowField
+from levels import LevelManager
+import content
+import savefile
 from time import perf_counter
 import random
 
@@ -11,11 +15,96 @@ SCREEN_WIDTH = 58
 SCREEN_HEIGHT = 36
 UPDATE_INTERVAL_MS = 14
 CELLSIZE = "12x12"
+# Seconds of game clock a normal-speed actor needs for one action.
+TURN_LENGTH = 0.5
+# Where F5 saves and F9 loads.
+SAVE_FILE = 'quicksave.sav'
 
 # Game state constants
 game_states = Game_States
 
 
+# Colours as BearLibTerminal uint32s, converted from their names once.
+packed_colors = {}
+# Interned Glyphs as (codepoint, color, bkcolor) ready for put_cells.
+packed_glyphs = {}
+
+
+def pack_color(name):
+    value = packed_colors.get(name)
+    if value is None:
+        value = packed_colors[name] = terminal.color_from_name(name)
+    return value
+
+
+def pack_glyph(entry):
+    cell = packed_glyphs.get(entry)
+    if cell is None:
+        cell = packed_glyphs[entry] = (ord(entry.glyph),
+                                       pack_color(entry.color),
+                                       pack_color(entry.bkcolor or 'black'))
+    return cell
+
+
+class ViewportCache:
+    """
+    Retained-mode bookkeeping for the viewport. Remembers the Glyph last
+    drawn in every screen cell, so a frame only has to touch the terminal
+    for cells whose glyph, colour or FOV state actually changed.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.offset = None
+        self.cells = [None] * (width * height)
+
+    def invalidate(self):
+        """Force the next frame to redraw everything."""
+        self.offset = None
+
+    def present(self, frame, offset):
+        """
+        Draw the cells of frame that differ from what is on screen. A
+        moved viewport means every cell is stale, so wipe the layer and
+        start over.
+        """
+        if offset != self.offset:
+            terminal.clear_area(0, 0, self.width, self.height)
+            self.cells = [None] * (self.width * self.height)
+            self.offset = offset
+        cells = self.cells
+        height = self.height
+        xs, ys, codes, colors, bkcolors = [], [], [], [], []
+        for idx, entry in enumerate(frame):
+            if entry is not cells[idx]:
+                x, y = divmod(idx, height)
+                if entry is None:
+                    terminal.clear_area(x, y, 1, 1)
+                else:
+                    code, color, bkcolor = pack_glyph(entry)
+                    xs.append(x)
+                    ys.append(y)
+                    codes.append(code)
+                    colors.append(color)
+                    bkcolors.append(bkcolor)
+                cells[idx] = entry
+        if xs:
+            terminal.put_cells(xs, ys, codes, colors, bkcolors)
+
+
+viewport_cache = ViewportCache(SCREEN_WIDTH, SCREEN_HEIGHT)
+ui_cache = []
+# Monsters further than a screen away sleep until the player comes closer.
+scheduler = Scheduler(turn_length=TURN_LENGTH, wake_radius=SCREEN_WIDTH)
+# One Dijkstra map toward the player per level, shared by everything that
+# chases them.
+chase_fields = {}
+# Set up by generate_world, the first time a level is asked for.
+levels = None
+# Set while R is waiting on the worker for the level's next map.
+regenerating = False
+
+
 def layer_wrap(func):
     def func_wrapper(*args, **kwargs):
         cur_layer = terminal.state(terminal.TK_LAYER)
@@ -25,7 +114,6 @@ def layer_wrap(func):
 
 
 def render(world, pc, offset):
-    terminal.clear()
     if pc.fog_toggle:
         world.calculate_fov(pc)
     render_viewport(world, pc, offset)
@@ -68,29 +156,25 @@ def render_viewport(world, pc, offset):
     global SCREEN_WIDTH, SCREEN_HEIGHT
     terminal.layer(0)
     offset_x, offset_y = offset
-    for col, column in enumerate(world):
-        if offset_x <= col < offset_x + SCREEN_WIDTH:
-            for row, tile in enumerate(column):
-                if offset_y <= row < offset_y + SCREEN_HEIGHT:
-                    if (tile.x, tile.y) in pc.viewed_map or not pc.fog_toggle:
-                        tile.build_char(world.fov_map,
-                                        pc.fog_toggle)
-                        if tile.occupied:
-                            terminal.print_(tile.x - offset_x,
-                                       tile.y - offset_y,
-                                       tile.occupied.char)
-                        elif tile.item:
-                            terminal.print_(tile.x - offset_x,
-                                       tile.y - offset_y,
-                                       tile.item.char)
-                        elif tile.prop:
-                            terminal.print_(tile.x - offset_x,
-                                       tile.y - offset_y,
-                                       tile.prop.char)
-                        else:
-                            terminal.print_(tile.x - offset_x,
-                                       tile.y - offset_y,
-                                       tile.char)
+    frame = [None] * (SCREEN_WIDTH * SCREEN_HEIGHT)
+    fog = pc.fog_toggle
+    for column in world.window(offset_x, offset_y,
+                               SCREEN_WIDTH, SCREEN_HEIGHT):
+        if not column:
+            continue
+        x, y0 = column[0].x, column[0].y
+        y1 = y0 + len(column)
+        # Whole columns of the bitsets at once, instead of a lookup a tile.
+        seen = pc.viewed_map.column(x, y0, y1)
+        if fog and 1 not in seen:
+            continue
+        lit = world.fov_map.column(x, y0, y1)
+        base = (x - offset_x) * SCREEN_HEIGHT - offset_y
+        for tile, was_seen, in_fov in zip(column, seen, lit):
+            if was_seen or not fog:
+                frame[base + tile.y] = tile.look_within(
+                    in_fov == 1 or not fog)
+    viewport_cache.present(frame, offset)
 
 
 @layer_wrap
@@ -98,15 +182,20 @@ def render_UI(world, pc):
     global SCREEN_WIDTH, SCREEN_HEIGHT
     spacing = 0
     loc = SCREEN_WIDTH + 1
+    lines = ["Name:   [color={}]{}".format(pc.color, pc.name),
+             "Health: [color={}]{}".format(COLOR['pink'], pc.cur_health),
+             "Mana:   [color={}]{}".format(COLOR['blue'], pc.cur_mana),
+             "X:      {}".format(pc.x),
+             "Y:      {}".format(pc.y)]
+    # Nothing on the layer gets cleared between frames any more, so only
+    # redraw when a line changed, and wipe the old text first.
+    if lines == ui_cache:
+        return
+    ui_cache[:] = lines
     terminal.layer(10)
-    terminal.print_(loc, 1 + spacing, "Name:   [color={}]{}".format(
-        pc.color, pc.name))
-    terminal.print_(loc, 2 + spacing, "Health: [color={}]{}".format(
-        COLOR['pink'], pc.cur_health))
-    terminal.print_(loc, 3 + spacing, "Mana:   [color={}]{}".format(
-        COLOR['blue'], pc.cur_mana))
-    terminal.print_(loc, 4 + spacing, "X:      {}".format(pc.x))
-    terminal.print_(loc, 5 + spacing, "Y:      {}".format(pc.y))
+    terminal.clear_area(loc, spacing, WINDOW_WIDTH - loc, len(lines) + 1)
+    for idx, line in enumerate(lines):
+        terminal.print_(loc, idx + 1 + spacing, line)
 
 
 @layer_wrap
@@ -130,46 +219,97 @@ def move_actor(world, pc, to):
 def try_door(world, pc):
     adjacent = pc.adjacent(world)
     for (x, y) in adjacent:
-        if world[x][y].check_door():
-            world[x][y].toggle_door()
+        tile = world[x][y]
+        if tile.check_door():
+            tile.toggle_door()
             pc.move(world, 0, 0)
 
 
 def generate_world(name):
-    w = []
-    with open("data/world.yaml", 'r') as world_yaml:
-        world = yaml.load_all(world_yaml)
-        for x in world:
-            w.append(x)
-        w = w[0]
-    w = w[name]
-    return Map(name=w['name'], width=w['width'], height=w['height'],
-               min_rooms=w['min_rooms'], max_rooms=w['max_rooms'],
-               num_exits=w['num_exits'], level=w['level'], region=w['region'])
+    global levels
+    if levels is None:
+        levels = LevelManager.from_content()
+    return levels.enter(name)
+
+
+def change_level(world, pc, step):
+    """
+    Take pc step levels down, or up if step is negative. Returns the map pc
+    ends up on, which is world if there's nowhere to go.
+    """
+    global regenerating
+    if levels is None:
+        return world
+    new_world = levels.travel(pc, step)
+    if new_world is None:
+        return world
+    # An R still waiting on the worker was for the level pc just left.
+    regenerating = False
+    scheduler.clear()
+    viewport_cache.invalidate()
+    return new_world
 
 
 def generate_player(world, race):
-    with open("data/player.yaml", 'r') as player_yaml:
-        pc = yaml.load(player_yaml)
+    pc = content.get().races[race]
     x, y = world.start_loc
-    pc = pc[race]
-    return Actor(world, pc['name'], x, y, pc['char'], pc['color'],
-                 pc['physical'], pc['max_health'], pc['max_mana'],
-                 pc['attack'], pc['defense'])
+    return Actor(world, pc.name, x, y, pc.char, pc.color, pc.physical,
+                 max_health=pc.max_health, max_mana=pc.max_mana,
+                 attack=pc.attack, defense=pc.defense)
 
 
 def generate_monsters(world):
-    with open('data/monsters.yaml', 'r') as monsters_yaml:
-        monsters = yaml.load(monsters_yaml)
-    print(monsters)
+    print(content.get().monsters)
+
+
+def chase_field(world):
+    field = chase_fields.get(world.name)
+    if field is None or field.world is not world:
+        field = FlowField(world, max_distance=SCREEN_WIDTH)
+        chase_fields[world.name] = field
+    return field
+
+
+def regenerate(world, pc):
+    """
+    Swap in a new map for this level if the worker has one built, or ask
+    update to keep checking until it does, so the frame loop never waits
+    on generation. Returns the map pc ends up on.
+    """
+    global regenerating
+    if levels is None:
+        world.generate_map(world.width, world.height, world.num_exits)
+        pc.place(world.start_loc)
+        world.register(pc)
+        pc.viewed_map = TileSet(world.width, world.height)
+        pc.fov_key = None
+        new_world = world
+    else:
+        new_world = levels.regenerate(pc, wait=False)
+    regenerating = new_world is None
+    if new_world is None:
+        return world
+    scheduler.clear()
+    viewport_cache.invalidate()
+    return new_world
 
 
 def update(world, pc, offset, time_elapsed, time_current):
+    if regenerating:
+        world = regenerate(world, pc)
+    if len(scheduler):
+        chase_field(world).update((pc.x, pc.y))
+    scheduler.advance(time_current, world, focus=(pc.x, pc.y))
     offset = find_offset(world, pc, offset)
+    # Build the chunks around the viewport before it scrolls onto them.
+    world.warm(offset[0] - CHUNK_SIZE, offset[1] - CHUNK_SIZE,
+               SCREEN_WIDTH + 2 * CHUNK_SIZE, SCREEN_HEIGHT + 2 * CHUNK_SIZE)
     return world, pc, offset
 
 
 def process_input(key, world, pc):
+    """Act on a key. Returns (world, pc), which loading a save replaces."""
+    global regenerating
     if key == terminal.TK_K:
         move_actor(world, pc, (0, -1))
     elif key == terminal.TK_J:
@@ -186,6 +326,10 @@ def process_input(key, world, pc):
         move_actor(world, pc, (-1, 1))
     elif key == terminal.TK_N:
         move_actor(world, pc, (1, 1))
+    elif key == terminal.TK_PERIOD and terminal.check(terminal.TK_SHIFT):
+        world = change_level(world, pc, 1)
+    elif key == terminal.TK_COMMA and terminal.check(terminal.TK_SHIFT):
+        world = change_level(world, pc, -1)
     elif key == terminal.TK_PERIOD:
         move_actor(world, pc, (0, 0))
     elif key == terminal.TK_C:
@@ -194,15 +338,34 @@ def process_input(key, world, pc):
         pc.fog_toggle = not pc.fog_toggle
     elif key == terminal.TK_S:
         pc.change_los()
+    elif key == terminal.TK_V:
+        pc.change_fov()
     elif key == terminal.TK_R:
-        world.generate_map(world.width, world.height, world.num_exits)
-        pc.place(world.start_loc)
-        world.register(pc)
-        pc.viewed_map = set()
+        world = regenerate(world, pc)
+    elif key == terminal.TK_F5:
+        savefile.save(SAVE_FILE, world, pc)
+    elif key == terminal.TK_F9:
+        # savefile turns anything wrong inside a save into a ValueError.
+        try:
+            loaded, player = savefile.load(SAVE_FILE)
+        except (OSError, ValueError) as e:
+            print("Couldn't load {}: {}".format(SAVE_FILE, e))
+        else:
+            if player is not None:
+                world.unregister(pc)
+                if levels is not None:
+                    levels.restore(loaded)
+                regenerating = False
+                scheduler.clear()
+                viewport_cache.invalidate()
+                world, pc = loaded, player
+    return world, pc
 
 
 def initialize():
     global WINDOW_WIDTH, WINDOW_HEIGHT, SCREEN_WIDTH, SCREEN_HEIGHT, CELLSIZE
+    viewport_cache.invalidate()
+    ui_cache.clear()
     terminal.open()
     terminal.set("window: size={}x{}, cellsize={}, title='Roguelike';"
              "font: default".format(
@@ -252,9 +415,10 @@ def main():
             if key == terminal.TK_CLOSE or key == terminal.TK_Q:
                 proceed = False
             else:
-                process_input(key, world, pc)
+                world, pc = process_input(key, world, pc)
 
     # if proceed is False, end the program
+    levels.close()
     terminal.close()
 
 if __name__ == '__main__':
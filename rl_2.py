@@ -3,7 +3,8 @@ from enum import IntEnum
 from collections.abc import Sequence
 import PyBearLibTerminal as terminal
 import random
-import yaml
+import content
+from scheduler import Scheduler
 
 class Game_States(IntEnum):
     MAIN_MENU = 0
@@ -61,6 +62,8 @@ class GameEngine:
         self.update_per_frame_limit = 10
         self.offset = Viewport(0, 0)
         self.actors = []
+        self.scheduler = Scheduler(turn_length=0.5,
+                                   wake_radius=self.screen_width)
         self.state = Game_States.IN_GAME
 
     def initialize_blt(self):
@@ -78,30 +81,28 @@ class GameEngine:
         terminal.color("white")
 
     def load_world_data(self):
-        with open('data/world.yaml', 'r') as world_yaml:
-            self.world_data = yaml.load(world_yaml)
+        self.world_data = content.get().levels
 
     def generate_level(self, name):
         current_level_data = self.world_data[name]
         try:
             self.current_world = Map(
-                name=current_level_data['name'],
-                width=current_level_data['width'],
-                height=current_level_data['height'],
-                min_rooms=current_level_data['min_rooms'],
-                max_rooms=current_level_data['max_rooms'],)
+                name=current_level_data.name,
+                width=current_level_data.width,
+                height=current_level_data.height,
+                min_rooms=current_level_data.min_rooms,
+                max_rooms=current_level_data.max_rooms,)
         except Exception as ex:
             print('you fucked up:', ex)
             return None
         self.generate_player('human')
 
     def generate_player(self, race):
-        with open('data/player.yaml', 'r') as player_yaml:
-            race_options = yaml.load(player_yaml)
-            self.races = race_options
+        race_options = content.get().races
+        self.races = race_options
         chosen_race = race_options[race]
         try:
-            self.pc = Thing(chosen_race['char'], 10, 10)
+            self.pc = Thing(chosen_race.char, 10, 10)
         except Exception as ex:
             print('you fucked up:', ex)
             return None
@@ -134,9 +135,14 @@ class GameEngine:
                 else:
                     proceed = self.process_input(key)
 
+    def add_actor(self, actor):
+        self.actors.append(actor)
+        self.scheduler.add(actor)
+
     def update(self, time_elapsed, time_current):
-        for actor in self.actors:
-            actor.take_turn()
+        # Only actors whose turn has come up do anything.
+        self.scheduler.advance(time_current, self.current_world,
+                               focus=(self.pc.x, self.pc.y))
 
     def render(self):
         terminal.clear()
@@ -0,0 +1,333 @@
+"""
+Saving and loading a Map, with everything on it, to a binary file.
+
+A save is a small fixed header, a JSON description of everything that isn't
+a layer (settings, rooms, tile kinds, props, items and actors), then the
+layers themselves as raw fixed-width arrays:
+
+    header   magic, format version, length of the description
+    JSON     the description, with where each array lives in the data
+    data     opaque, walkable and occupied a byte a tile, every actor's
+             viewed_map a byte a tile, then the tile kinds of any chunk
+             that changed after it was painted, as little-endian uint16
+             codes into the saved palette
+
+Loading maps the file and copies the layers straight out of it. No tiles are
+built; chunks get painted from the rooms the same as on a freshly generated
+map, so loading even a 325x325 quadrant is a few milliseconds instead of a
+whole regeneration.
+
+Actors come back without their ai, which is code; whoever loads them has to
+hand it out again.
+"""
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import count
+
+from Thing import (Actor, Item, Prop, Map, RectRoom, TileSet, LOS_Shape,
+                   FOV_Algo, KIND_FIELDS, tile_kind)
+
+MAGIC = b'RLSV'
+# Bump whenever the layout changes; load refuses versions it doesn't know.
+VERSION = 1
+# Magic, version, length of the JSON description.
+HEADER = struct.Struct('<4sHI')
+
+MAP_FIELDS = ('name', 'width', 'height', 'min_rooms', 'max_rooms',
+              'num_exits', 'level', 'region')
+THING_FIELDS = ('x', 'y', 'glyph', 'color', 'physical', 'visible')
+ACTOR_FIELDS = ('name', 'max_health', 'cur_health', 'max_mana', 'cur_mana',
+                'attack', 'defense', 'base_radius', 'radius', 'base_speed',
+                'speed', 'fog_toggle')
+
+
+class _Blocks:
+    """The data section as it's being put together."""
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def add(self, data):
+        """Append data, returning [offset, size] for the description."""
+        entry = [self.size, len(data)]
+        self.parts.append(data)
+        self.size += len(data)
+        return entry
+
+
+def _record(thing, fields):
+    return {field: getattr(thing, field) for field in fields}
+
+
+def _item_record(item):
+    record = _record(item, THING_FIELDS)
+    record.update(id=item.entity_id, name=item.name)
+    return record
+
+
+def _little_endian(codes):
+    if sys.byteorder != 'little':
+        codes = array('H', codes)
+        codes.byteswap()
+    return codes.tobytes()
+
+
+def _dirty_chunks(world):
+    """(key, codes) for every chunk that can't just be painted again."""
+    code = world.palette_code
+    for key, chunk in world.chunks.items():
+        if chunk.dirty:
+            yield key, array('H', (code(tile.kind) for column in chunk.columns
+                                   for tile in column))
+    for key in world.chunk_store.index:
+        if key not in world.chunks:
+            yield key, world.chunk_store.read(key)
+
+
+def describe(world, player, blocks):
+    """The JSON-ready description of world, adding its arrays to blocks."""
+    props, items, actors = [], [], []
+    for entity in world.entities.values():
+        if isinstance(entity, Actor):
+            actors.append(entity)
+        elif isinstance(entity, Item):
+            items.append(entity)
+        elif isinstance(entity, Prop):
+            props.append(entity)
+
+    actor_records = []
+    for actor in actors:
+        record = _record(actor, THING_FIELDS + ACTOR_FIELDS)
+        viewed = actor.viewed_map
+        record.update(
+            id=actor.entity_id,
+            los_shape=int(actor.los_shape),
+            fov_algo=int(actor.fov_algo),
+            apparel=sorted(actor.apparel),
+            inventory=[_item_record(item) for item in actor.inventory],
+            viewed_map={'x0': viewed.x0, 'y0': viewed.y0,
+                        'width': viewed.width, 'height': viewed.height,
+                        'bits': blocks.add(viewed.bits)})
+        actor_records.append(record)
+
+    prop_records = []
+    for prop in props:
+        record = _record(prop, THING_FIELDS)
+        record.update(id=prop.entity_id, is_door=prop.is_door,
+                      door_status=prop.door_status)
+        prop_records.append(record)
+
+    layers = {name: blocks.add(getattr(world, name))
+              for name in ('opaque', 'walkable', 'occupied')}
+    chunks = [[cx, cy, blocks.add(_little_endian(codes))]
+              for (cx, cy), codes in _dirty_chunks(world)]
+    rooms = [[room.x_left, room.y_top, room.x_right - room.x_left,
+              room.y_bottom - room.y_top] for room in world.rooms]
+
+    # Peek at the next entity ID without using it up.
+    next_id = world.new_entity_id()
+    world.entity_ids = count(next_id)
+    return {
+        'map': _record(world, MAP_FIELDS),
+        'seed': world.seed,
+        'start_loc': world.start_loc,
+        'revision': world.revision,
+        'next_entity_id': next_id,
+        'generation_stats': world.generation_stats,
+        'rooms': rooms,
+        'bounds': (world.rooms.index(world.bounds)
+                   if world.bounds in world.rooms else None),
+        'palette': [[getattr(kind, field) for field in KIND_FIELDS]
+                    for kind in world.palette],
+        'layers': layers,
+        'chunks': chunks,
+        'props': prop_records,
+        'items': [_item_record(item) for item in items],
+        'actors': actor_records,
+        'player': player.entity_id if player is not None else None,
+        }
+
+
+def _write(out, world, player):
+    blocks = _Blocks()
+    description = json.dumps(describe(world, player, blocks),
+                             separators=(',', ':')).encode('utf-8')
+    out.write(HEADER.pack(MAGIC, VERSION, len(description)))
+    out.write(description)
+    for part in blocks.parts:
+        out.write(part)
+
+
+def save(path, world, player=None):
+    """
+    Write world, with every actor, item and prop registered on it, to path.
+    player is remembered so load can hand it back. The file is written
+    next to path and moved into place, so a crash never leaves half a save.
+    """
+    temp = path + '.tmp'
+    with open(temp, 'wb') as out:
+        _write(out, world, player)
+    os.replace(temp, path)
+
+
+def dumps(world, player=None):
+    """save, to bytes instead of a file."""
+    out = io.BytesIO()
+    _write(out, world, player)
+    return out.getvalue()
+
+
+def _restore_entity(world, entity, record):
+    """
+    Give a freshly made entity its saved ID and register it. The ID has to
+    be set first: asking for entity_id before then would hand out a new
+    one, which could be the saved ID of something restored already.
+    """
+    entity._entity_id = record['id']
+    entity.visible = record['visible']
+    entity.world = world
+    world.add_entity(entity)
+    return entity
+
+
+def _make_item(record, world=None):
+    item = Item(record['name'], record['x'], record['y'], record['glyph'],
+                record['color'], record['physical'], world=world)
+    item._entity_id = record['id']
+    item.visible = record['visible']
+    return item
+
+
+def _check_size(what, data, size):
+    if len(data) != size:
+        raise ValueError("save file's {} is {} bytes, expected {}"
+                         .format(what, len(data), size))
+
+
+def restore(description, data):
+    """
+    Rebuild a map from a description and its data section, any buffer.
+    Returns (world, player). Raises ValueError if the two don't add up.
+    """
+    settings = description['map']
+    world = Map(generate=False, **settings)
+    world.seed = description['seed']
+    world.revision = description['revision']
+    world.generation_stats = description['generation_stats']
+    world.generate_ground()
+    size = world.width * world.height
+
+    def block(entry):
+        offset, length = entry
+        return data[offset:offset + length]
+
+    for name, entry in description['layers'].items():
+        layer = bytearray(block(entry))
+        _check_size('{} layer'.format(name), layer, size)
+        setattr(world, name, layer)
+
+    for x, y, w, h in description['rooms']:
+        room = RectRoom(x, y, w, h)
+        world.rooms.append(room)
+        world.index_room(room)
+    if description['bounds'] is not None:
+        world.bounds = world.rooms[description['bounds']]
+    if description['start_loc'] is not None:
+        world.start_loc = tuple(description['start_loc'])
+
+    for fields in description['palette']:
+        world.palette_code(tile_kind(*fields))
+    for cx, cy, entry in description['chunks']:
+        x0, y0, x1, y1 = world.chunk_bounds(cx, cy)
+        tiles = block(entry)
+        _check_size('chunk {},{}'.format(cx, cy), tiles,
+                    (x1 - x0) * (y1 - y0) * 2)
+        codes = array('H')
+        codes.frombytes(tiles)
+        if max(codes, default=0) >= len(world.palette):
+            raise ValueError("save file's chunk {},{} has tile kinds outside "
+                             "its palette".format(cx, cy))
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        world.chunk_store.save((cx, cy), codes)
+
+    # Props and items before actors: making an actor builds the chunk it
+    # stands in, which needs the doors to be there already.
+    for record in description['props']:
+        prop = Prop(record['x'], record['y'], record['glyph'],
+                    record['color'], record['physical'], world=world)
+        prop.update(is_door=record['is_door'],
+                    door_status=record['door_status'])
+        _restore_entity(world, prop, record)
+    for record in description['items']:
+        _restore_entity(world, _make_item(record, world), record)
+
+    player = None
+    for record in description['actors']:
+        actor = Actor(world, record['name'], record['x'], record['y'],
+                      record['glyph'], record['color'], record['physical'],
+                      entity_id=record['id'])
+        for field in ACTOR_FIELDS:
+            setattr(actor, field, record[field])
+        actor.los_shape = LOS_Shape(record['los_shape'])
+        actor.fov_algo = FOV_Algo(record['fov_algo'])
+        actor.apparel = set(record['apparel'])
+        actor.inventory = [_make_item(item) for item in record['inventory']]
+        viewed = record['viewed_map']
+        actor.viewed_map = TileSet(viewed['width'], viewed['height'],
+                                   viewed['x0'], viewed['y0'])
+        bits = bytearray(block(viewed['bits']))
+        _check_size("{}'s viewed_map".format(actor.name), bits,
+                    actor.viewed_map.width * actor.viewed_map.height)
+        actor.viewed_map.bits = bits
+        _restore_entity(world, actor, record)
+        if record['id'] == description['player']:
+            player = actor
+
+    world.entity_ids = count(description['next_entity_id'])
+    return world, player
+
+
+def _read(buffer, name):
+    """
+    restore from a whole save. Anything wrong with it, down to a file cut
+    short, comes out as a ValueError.
+    """
+    try:
+        magic, version, length = HEADER.unpack_from(buffer)
+    except struct.error:
+        raise ValueError("{} is too short to be a save file".format(name))
+    if magic != MAGIC:
+        raise ValueError("{} is not a save file".format(name))
+    if version != VERSION:
+        raise ValueError("{} is a version {} save, expected {}"
+                         .format(name, version, VERSION))
+    start = HEADER.size + length
+    if start > len(buffer):
+        raise ValueError("{} is cut short".format(name))
+    with memoryview(buffer) as view:
+        description = json.loads(bytes(view[HEADER.size:start]))
+        with view[start:] as data:
+            try:
+                return restore(description, data)
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                raise ValueError("{} is damaged ({}: {})".format(
+                    name, type(e).__name__, e)) from e
+
+
+def load(path):
+    """Read a save written by save. Returns (world, player)."""
+    with open(path, 'rb') as save_file:
+        with mmap.mmap(save_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as mapped:
+            return _read(mapped, path)
+
+
+def loads(data):
+    """load, from bytes written by dumps."""
+    return _read(data, 'data')
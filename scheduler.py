@@ -0,0 +1,155 @@
+"""
+Turn scheduling for everything that isn't the player.
+
+Actors sit in a heap keyed on the game-clock time of their next action, so
+each update only touches the actors that are actually due. An action's cost
+is measured in turns and stretched or shrunk by the actor's speed, where
+NORMAL_SPEED acts once per turn_length. Actors that have nothing to do, or
+that are too far from the focus (usually the player), are put to sleep and
+cost nothing until they are woken again. Those that were too far are woken
+when the focus comes close, and are kept bucketed by position so finding
+them doesn't mean looking at every sleeper; the rest sleep until somebody
+calls wake.
+"""
+from heapq import heappush, heappop
+from itertools import count
+
+NORMAL_SPEED = 100
+# Side length, in tiles, of the buckets far-away sleepers are filed under.
+BUCKET_SIZE = 32
+
+
+class Scheduler:
+    def __init__(self, turn_length=1.0, wake_radius=None):
+        self.turn_length = turn_length
+        # Actors further than this from the focus sleep instead of acting.
+        # None means everybody stays awake.
+        self.wake_radius = wake_radius
+        self.now = 0
+        self.focus = None
+        self.queue = []
+        self.counter = count()
+        # entity_id -> heap entry, for actors waiting for their turn.
+        self.scheduled = {}
+        # entity_id -> actor, for actors that are out of the queue.
+        self.sleeping = {}
+        # The ones that were too far, by bucket, and the bucket of each.
+        self.distant = {}
+        self.distant_buckets = {}
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def __contains__(self, actor):
+        return (actor.entity_id in self.scheduled
+                or actor.entity_id in self.sleeping)
+
+    def clear(self):
+        self.queue.clear()
+        self.scheduled.clear()
+        self.sleeping.clear()
+        self.distant.clear()
+        self.distant_buckets.clear()
+        self.focus = None
+
+    def delay(self, actor, cost=1):
+        """How long an action costing cost turns takes actor."""
+        speed = getattr(actor, 'speed', NORMAL_SPEED) or 1
+        return self.turn_length * cost * NORMAL_SPEED / speed
+
+    def _push(self, actor, when):
+        entry = [when, next(self.counter), actor]
+        self.scheduled[actor.entity_id] = entry
+        heappush(self.queue, entry)
+
+    def add(self, actor, delay=None):
+        """
+        Schedule actor to act after delay, or after one of its turns if no
+        delay is given. Rescheduling an actor replaces its old slot.
+        """
+        self.remove(actor)
+        if delay is None:
+            delay = self.delay(actor)
+        self._push(actor, self.now + delay)
+
+    def remove(self, actor):
+        entry = self.scheduled.pop(actor.entity_id, None)
+        if entry is not None:
+            # Left in the heap and skipped when it comes up.
+            entry[2] = None
+        self.sleeping.pop(actor.entity_id, None)
+        self._forget_distant(actor.entity_id)
+
+    def sleep(self, actor):
+        self.remove(actor)
+        self.sleeping[actor.entity_id] = actor
+
+    def _sleep_distant(self, actor):
+        """Sleep an actor that was too far, filed so wake_near finds it."""
+        key = (actor.x // BUCKET_SIZE, actor.y // BUCKET_SIZE)
+        self.sleeping[actor.entity_id] = actor
+        self.distant.setdefault(key, {})[actor.entity_id] = actor
+        self.distant_buckets[actor.entity_id] = key
+
+    def _forget_distant(self, entity_id):
+        key = self.distant_buckets.pop(entity_id, None)
+        if key is not None:
+            bucket = self.distant[key]
+            del bucket[entity_id]
+            if not bucket:
+                del self.distant[key]
+
+    def wake(self, actor, delay=0):
+        if self.sleeping.pop(actor.entity_id, None) is not None:
+            self._forget_distant(actor.entity_id)
+            self._push(actor, self.now + delay)
+
+    def wake_near(self, x, y, radius):
+        """
+        Wake the actors that slept for being too far and are within radius
+        of (x, y). Only the buckets the square touches are looked at.
+        """
+        for bx in range((x - radius) // BUCKET_SIZE,
+                        (x + radius) // BUCKET_SIZE + 1):
+            for by in range((y - radius) // BUCKET_SIZE,
+                            (y + radius) // BUCKET_SIZE + 1):
+                bucket = self.distant.get((bx, by))
+                if bucket is None:
+                    continue
+                for actor in list(bucket.values()):
+                    if max(abs(actor.x - x), abs(actor.y - y)) <= radius:
+                        self.wake(actor)
+
+    def too_far(self, actor):
+        if self.wake_radius is None or self.focus is None:
+            return False
+        fx, fy = self.focus
+        return max(abs(actor.x - fx), abs(actor.y - fy)) > self.wake_radius
+
+    def advance(self, until, world, focus=None):
+        """
+        Let every actor whose turn comes up by game time until act, in
+        order. Actor.take_turn returns the cost of what it did in turns, or
+        None if it has nothing to do and wants to sleep until woken.
+        """
+        if focus is not None and focus != self.focus:
+            self.focus = focus
+            if self.wake_radius is not None:
+                self.wake_near(focus[0], focus[1], self.wake_radius)
+        queue = self.queue
+        while queue and queue[0][0] <= until:
+            when, _, actor = heappop(queue)
+            if actor is None:
+                continue
+            del self.scheduled[actor.entity_id]
+            self.now = when
+            if self.too_far(actor):
+                self._sleep_distant(actor)
+                continue
+            cost = actor.take_turn(world)
+            if cost is None:
+                self.sleeping[actor.entity_id] = actor
+            elif actor not in self:
+                # Unless take_turn already rescheduled or slept it.
+                self._push(actor, when + self.delay(actor, cost))
+        self.now = max(self.now, until)
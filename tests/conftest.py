@@ -0,0 +1,13 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Nothing under test should need a display.
+os.environ.setdefault('BEARLIBTERMINAL_BACKEND', 'headless')
+
+import content  # noqa: E402
+
+# Parse the real data once, without caching it, so the suite never writes
+# content.cache into data/. test_content covers the cache on copies.
+content._loaded[content.DATA_DIR] = content.parse()
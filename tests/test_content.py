@@ -0,0 +1,108 @@
+import os
+import pickle
+import shutil
+
+import pytest
+
+import content
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    for filename, _, _, _ in content.SCHEMAS:
+        shutil.copy(os.path.join(content.DATA_DIR, filename), data)
+    return str(data)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts content.parse calls, i.e. cache misses."""
+    calls = []
+    parse = content.parse
+
+    def counted(data_dir=content.DATA_DIR):
+        calls.append(data_dir)
+        return parse(data_dir)
+
+    monkeypatch.setattr(content, 'parse', counted)
+    return calls
+
+
+def cache_path(data_dir):
+    return os.path.join(data_dir, content.CACHE_FILE)
+
+
+def read_cache(data_dir):
+    with open(cache_path(data_dir), 'rb') as cache:
+        return pickle.load(cache)
+
+
+def test_unchanged_sources_come_from_the_cache(data_dir, parses):
+    first = content.load(data_dir)
+    assert len(parses) == 1
+    assert os.path.exists(cache_path(data_dir))
+    assert content.load(data_dir) == first
+    assert len(parses) == 1
+
+
+def test_touched_file_with_same_contents_is_a_hit(data_dir, parses):
+    first = content.load(data_dir)
+    path = os.path.join(data_dir, 'world.yaml')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert content.load(data_dir) == first
+    assert len(parses) == 1
+    # The new stamp is remembered, so next time there's nothing to hash.
+    stamp = read_cache(data_dir)['sources']['world.yaml']['stamp']
+    assert stamp == content._stamp(path)
+
+
+def test_changed_contents_are_parsed_again(data_dir, parses):
+    first = content.load(data_dir)
+    path = os.path.join(data_dir, 'world.yaml')
+    with open(path) as source:
+        text = source.read()
+    assert 'width: 70' in text
+    with open(path, 'w') as source:
+        source.write(text.replace('width: 70', 'width: 71', 1))
+    changed = content.load(data_dir)
+    assert len(parses) == 2
+    assert changed != first
+    assert 71 in [level.width for level in changed.levels.values()]
+    assert content.load(data_dir) == changed
+    assert len(parses) == 2
+
+
+def test_cache_version_bump_throws_the_cache_away(data_dir, parses,
+                                                  monkeypatch):
+    content.load(data_dir)
+    monkeypatch.setattr(content, 'CACHE_VERSION', content.CACHE_VERSION + 1)
+    content.load(data_dir)
+    assert len(parses) == 2
+    assert read_cache(data_dir)['version'] == content.CACHE_VERSION
+
+
+def test_corrupt_cache_is_parsed_again_and_replaced(data_dir, parses):
+    first = content.load(data_dir)
+    with open(cache_path(data_dir), 'wb') as cache:
+        cache.write(b'not a pickle')
+    assert content.load(data_dir) == first
+    assert len(parses) == 2
+    assert read_cache(data_dir)['content'] == first
+
+
+def test_explicit_cache_path(data_dir, tmp_path, parses):
+    elsewhere = str(tmp_path / 'elsewhere.cache')
+    content.load(data_dir, cache_path=elsewhere)
+    assert os.path.exists(elsewhere)
+    assert not os.path.exists(cache_path(data_dir))
+    content.load(data_dir, cache_path=elsewhere)
+    assert len(parses) == 1
+
+
+def test_schema_errors_name_the_entry():
+    with pytest.raises(content.ContentError, match='town'):
+        content.compile_entries('world.yaml', {'town': {'name': 'town'}},
+                                content.LevelDef, content.SCHEMAS[0][3])
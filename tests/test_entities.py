@@ -0,0 +1,82 @@
+from itertools import count
+
+import content
+import savefile
+import Thing
+from levels import build_level
+from Thing import Item, Map, COLOR
+
+
+def build_world():
+    return build_level(content.get().levels['debug'], 1)
+
+
+def test_remove_entity_leaves_lookalikes_alone():
+    world = build_world()
+    x, y = world.start_loc
+    first = Item('rock', x, y, '*', COLOR['white'], False, world=world)
+    second = Item('rock', x, y, '*', COLOR['white'], False, world=world)
+    assert first == second
+    world.place_item(first, x, y)
+    world.place_item(second, x, y)
+    world.remove_entity(second)
+    assert world.entities_at(x, y) == (first,)
+    assert world.entities_at(x, y)[0] is first
+
+
+def test_move_entity_moves_the_right_lookalike():
+    world = build_world()
+    x, y = world.start_loc
+    first = Item('rock', x, y, '*', COLOR['white'], False, world=world)
+    second = Item('rock', x, y, '*', COLOR['white'], False, world=world)
+    world.place_item(first, x, y)
+    world.place_item(second, x, y)
+    world.move_entity(second, x + 1, y)
+    assert world.entities_at(x, y)[0] is first
+    assert world.entities_at(x + 1, y)[0] is second
+
+
+def door_ids(world):
+    return sorted(entity_id for entity_id, entity in world.entities.items()
+                  if getattr(entity, 'is_door', False))
+
+
+def test_items_from_elsewhere_get_ids_of_this_map(monkeypatch):
+    world = build_world()
+    doors = door_ids(world)
+    assert doors and doors[0] == 1
+    x, y = world.start_loc
+    # An item that got an orphan ID before it had a map...
+    monkeypatch.setattr(Thing, 'ORPHAN_IDS', count(1))
+    orphan = Item('rock', x, y, '*', COLOR['white'], False)
+    assert orphan.entity_id == 1
+    # ...and one registered on a map with nothing else on it yet.
+    other = Map('other', 20, 20, 1, 1, 2, None, 'start', generate=False)
+    other.generate_ground()
+    stray = Item('rock', 1, 1, '*', COLOR['white'], False)
+    other.place_item(stray, 1, 1)
+    assert stray.entity_id == 1
+    other.remove_entity(stray)
+
+    world.place_item(orphan, x, y)
+    world.place_item(stray, x + 1, y)
+    assert door_ids(world) == doors
+    assert orphan.world is world and stray.world is world
+    assert world.entities[orphan.entity_id] is orphan
+    assert world.entities[stray.entity_id] is stray
+    loaded, _ = savefile.loads(savefile.dumps(world))
+    assert door_ids(loaded) == doors
+    assert len(loaded.entities) == len(world.entities)
+
+
+def test_membership_checks_dont_use_up_ids():
+    world = build_world()
+    x, y = world.start_loc
+    rock = Item('rock', x, y, '*', COLOR['white'], False, world=world)
+    next_id = world.new_entity_id()
+    assert rock not in world
+    world.remove_entity(rock)
+    assert rock._entity_id is None
+    world.place_item(rock, x, y)
+    assert rock in world
+    assert rock.entity_id == next_id + 1
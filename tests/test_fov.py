@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import content
+from levels import build_level
+from Thing import Actor, FOV_Algo, LOS_Shape, COLOR
+
+
+def floor_seen(world, points):
+    return {(x, y) for x, y in points
+            if world.in_bounds(x, y) and world.walkable[world.index(x, y)]}
+
+
+@pytest.mark.parametrize('name', ['debug', 'town', 'dungeon_1'])
+@pytest.mark.parametrize('seed', range(5))
+def test_shadowcast_matches_raycast_floor_at_room_centres(name, seed):
+    world = build_level(content.get().levels[name], seed)
+    pc = Actor(world, 'test', *world.start_loc, '@', COLOR['white'], True)
+    for room in world.rooms:
+        if room is world.bounds:
+            continue
+        world.unregister(pc)
+        pc.x, pc.y = room.center()
+        world.register(pc)
+        pc.fov_algo = FOV_Algo.SHADOWCAST
+        shadowcast = floor_seen(world, world.shadowcast_fov(pc))
+        pc.fov_algo = FOV_Algo.RAYCAST
+        raycast = floor_seen(world, world.raycast_fov(pc))
+        assert shadowcast == raycast, room.center()
+
+
+@pytest.mark.parametrize('name', ['debug', 'town', 'dungeon_1'])
+@pytest.mark.parametrize('seed', range(3))
+def test_numpy_fill_matches_python_fill(name, seed):
+    pytest.importorskip('numpy')
+    world = build_level(content.get().levels[name], seed)
+    pc = Actor(world, 'test', *world.start_loc, '@', COLOR['white'], True)
+    pc.fov_algo = FOV_Algo.RAYCAST
+    rng = random.Random(seed)
+    floor = [(x, y) for x in range(world.width) for y in range(world.height)
+             if world.walkable[world.index(x, y)]]
+    for x, y in rng.sample(floor, 10):
+        world.unregister(pc)
+        pc.x, pc.y = x, y
+        world.register(pc)
+        for shape in LOS_Shape:
+            for radius in (4, 8, 16):
+                pc.los_shape, pc.radius = shape, radius
+                world.fill_polygon = world.fill_polygon_python
+                python = set(world.raycast_fov(pc))
+                world.fill_polygon = world.fill_polygon_numpy
+                filled = set(world.raycast_fov(pc))
+                assert filled == python, (x, y, shape, radius)
@@ -0,0 +1,19 @@
+from levels import LevelManager
+from Thing import Actor, COLOR
+
+
+def test_travel_forgets_the_last_maps_fov():
+    levels = LevelManager.from_content(seed=1, pregenerate=False)
+    try:
+        world = levels.enter('town')
+        pc = Actor(world, 'pc', *world.start_loc, '@', COLOR['white'], True)
+        world.calculate_fov(pc)
+        assert pc.fov_key is not None
+        below = levels.travel(pc, 1)
+        assert below is not world
+        assert pc.fov_key is None
+        below.calculate_fov(pc)
+        assert (pc.x, pc.y) in pc.viewed_map
+        assert below.fov_map is pc.fov_map
+    finally:
+        levels.close()
@@ -0,0 +1,33 @@
+import pytest
+
+import mapgen
+
+
+@pytest.mark.parametrize('room_size', [['1', '1'], ['8', '3'], ['0', '4']])
+def test_bad_room_size_is_a_usage_error(room_size, capsys):
+    with pytest.raises(SystemExit) as exit:
+        mapgen.main(['debug', '-n', '1', '-j', '1', '--room-size']
+                    + room_size)
+    assert exit.value.code == 2
+    assert '--room-size' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('args', [
+    ['--room-size', '2', '60'],
+    ['--room-size', '2', '36'],
+    ['--width', '8'],
+    ['--height', '12', '--room-size', '3', '12'],
+    ])
+def test_rooms_bigger_than_the_map_are_a_usage_error(args, capsys):
+    with pytest.raises(SystemExit) as exit:
+        mapgen.main(['debug', '-n', '3', '-j', '1'] + args)
+    assert exit.value.code == 2
+    assert '--room-size' in capsys.readouterr().err
+
+
+def test_largest_rooms_that_fit(tmp_path):
+    output = str(tmp_path / 'stats.jsonl')
+    assert mapgen.main(['debug', '-n', '3', '-j', '1', '--room-size', '2',
+                        '35', '--output', output]) == 0
+    with open(output) as lines:
+        assert len(lines.readlines()) == 3
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+import content
+from levels import build_level
+from pathfinding import FlowField, Pathfinder
+
+
+def build_world(name, seed):
+    return build_level(content.get().levels[name], seed)
+
+
+def floor_tiles(world):
+    return [(x, y) for x in range(world.width) for y in range(world.height)
+            if world.walkable[world.index(x, y)]]
+
+
+def path_cost(pathfinder, path):
+    return sum(pathfinder.costs[pathfinder.pad(x, y)] for x, y in path)
+
+
+def edit(world, rng):
+    """Toggle a door, or knock down or put up a bit of wall."""
+    doors = [entity for entity in world.entities.values()
+             if getattr(entity, 'is_door', False)]
+    choice = rng.random()
+    if doors and choice < 0.5:
+        door = rng.choice(doors)
+        world.tile(door.x, door.y).toggle_door()
+        return
+    x = rng.randrange(1, world.width - 1)
+    y = rng.randrange(1, world.height - 1)
+    tile = world.tile(x, y)
+    if tile.check_door():
+        return
+    tile.physical = not tile.physical
+
+
+@pytest.mark.parametrize('max_distance', [None, 20])
+@pytest.mark.parametrize('name', ['debug', 'town', 'dungeon_1'])
+@pytest.mark.parametrize('seed', range(3))
+def test_repaired_fields_match_full_recomputes(name, seed, max_distance):
+    world = build_world(name, seed)
+    rng = random.Random(seed)
+    goal = world.start_loc
+    field = FlowField(world, max_distance=max_distance)
+    field.update(goal)
+    for _ in range(10):
+        edit(world, rng)
+        field.update(goal)
+        fresh = FlowField(world, max_distance=max_distance)
+        fresh.update(goal)
+        assert field.dist == fresh.dist
+
+
+@pytest.mark.parametrize('name', ['debug', 'town', 'dungeon_1'])
+@pytest.mark.parametrize('seed', range(4))
+def test_astar_cost_matches_field_distance(name, seed):
+    world = build_world(name, seed)
+    rng = random.Random(seed)
+    # A closed door or two on the way makes the costs more than steps.
+    for _ in range(5):
+        edit(world, rng)
+    goal = world.start_loc
+    field = FlowField(world)
+    field.update(goal)
+    pathfinder = Pathfinder(world)
+    for start in rng.sample(floor_tiles(world), 20):
+        path = pathfinder.find_path(start, goal)
+        distance = field.distance(*start)
+        if start == goal:
+            assert path == [] and distance == 0
+        elif path is None:
+            assert distance is None
+        else:
+            assert path[-1] == goal
+            assert path_cost(pathfinder, path) == distance
+
+
+def test_astar_paths_are_connected_and_avoid_walls():
+    world = build_world('dungeon_1', 1)
+    pathfinder = Pathfinder(world)
+    rng = random.Random(1)
+    floor = floor_tiles(world)
+    for _ in range(20):
+        start, goal = rng.sample(floor, 2)
+        path = pathfinder.find_path(start, goal)
+        if path is None:
+            continue
+        previous = start
+        for x, y in path:
+            assert max(abs(x - previous[0]), abs(y - previous[1])) == 1
+            assert world.walkable[world.index(x, y)]
+            previous = (x, y)
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+import content
+import rl
+import savefile
+from levels import LevelManager
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    monkeypatch.setattr(rl, 'levels', LevelManager.from_content(seed=1))
+    monkeypatch.setattr(rl, 'regenerating', False)
+    monkeypatch.setattr(rl, 'SAVE_FILE', os.path.join(tmp_path, 'quick.sav'))
+    world = rl.generate_world('town')
+    pc = rl.generate_player(world, next(iter(content.get().races)))
+    yield world, pc
+    rl.levels.close()
+
+
+def test_taking_the_stairs_drops_a_waiting_regenerate(game):
+    world, pc = game
+    rl.regenerating = True
+    below = rl.change_level(world, pc, 1)
+    assert below is not world
+    assert not rl.regenerating
+    assert rl.update(below, pc, (0, 0), 0, 0)[0] is below
+
+
+def test_loading_drops_a_waiting_regenerate(game):
+    world, pc = game
+    savefile.save(rl.SAVE_FILE, world, pc)
+    rl.regenerating = True
+    loaded, player = rl.process_input(rl.terminal.TK_F9, world, pc)
+    assert loaded is not world
+    assert not rl.regenerating
+    assert rl.update(loaded, player, (0, 0), 0, 0)[0] is loaded
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import savefile
+from Thing import Map, Actor, Item, COLOR
+
+
+def entity_summary(world):
+    return {entity_id: (type(entity).__name__, entity.x, entity.y,
+                        entity.glyph)
+            for entity_id, entity in world.entities.items()}
+
+
+def build_world():
+    """A map whose entity IDs don't start at 1, after a regeneration."""
+    world = Map('test', 60, 40, 2, 2, 2, None, 'start', seed=1)
+    Actor(world, 'pc', *world.start_loc, '@', COLOR['white'], True)
+    world.min_rooms = world.max_rooms = 12
+    world.generate_map(world.width, world.height, world.num_exits, seed=1)
+    pc = Actor(world, 'pc', *world.start_loc, '@', COLOR['white'], True)
+    x, y = world.start_loc
+    world.place_item(Item('rock', x + 1, y, '*', COLOR['white'], False),
+                     x + 1, y)
+    return world, pc
+
+
+def test_round_trip_keeps_non_contiguous_ids():
+    world, pc = build_world()
+    ids = sorted(world.entities)
+    assert ids[0] > 1 and len(ids) > 3
+    loaded, player = savefile.loads(savefile.dumps(world, pc))
+    assert entity_summary(loaded) == entity_summary(world)
+    assert player.entity_id == pc.entity_id
+    assert loaded.entities[pc.entity_id] is player
+    # And nothing is lost the second time round either.
+    again, _ = savefile.loads(savefile.dumps(loaded, player))
+    assert entity_summary(again) == entity_summary(world)
+    assert loaded.new_entity_id() == world.new_entity_id()
+
+
+def test_damaged_saves_raise_value_error():
+    world, pc = build_world()
+    data = savefile.dumps(world, pc)
+    length = savefile.HEADER.unpack_from(data)[2]
+    start = savefile.HEADER.size + length
+    description = json.loads(data[savefile.HEADER.size:start])
+
+    def with_description(changed):
+        text = json.dumps(changed).encode('utf-8')
+        return (savefile.HEADER.pack(savefile.MAGIC, savefile.VERSION,
+                                     len(text)) + text + data[start:])
+
+    short_bits = json.loads(json.dumps(description))
+    bits = short_bits['actors'][0]['viewed_map']['bits']
+    bits[1] -= 1
+    damaged = [data[:5], data[:start - 1], data[:-1],
+               with_description({key: value for key, value in
+                                 description.items() if key != 'actors'}),
+               with_description(short_bits)]
+    for broken in damaged:
+        with pytest.raises(ValueError):
+            savefile.loads(broken)
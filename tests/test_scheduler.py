@@ -0,0 +1,100 @@
+from scheduler import Scheduler, NORMAL_SPEED
+
+
+class Dummy:
+    """Just enough of an Actor for the scheduler."""
+    def __init__(self, entity_id, x=0, y=0, speed=NORMAL_SPEED, cost=1):
+        self.entity_id = entity_id
+        self.x, self.y = x, y
+        self.speed = speed
+        self.cost = cost
+        self.turns = []
+
+    def take_turn(self, world):
+        self.turns.append(world.now)
+        return self.cost
+
+
+class Clock:
+    """Stands in for the world, so actors can see the time they act at."""
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    @property
+    def now(self):
+        return self.scheduler.now
+
+
+def test_fast_actors_act_more_often():
+    scheduler = Scheduler(turn_length=1.0)
+    slow = Dummy(1, speed=NORMAL_SPEED)
+    fast = Dummy(2, speed=NORMAL_SPEED * 2)
+    scheduler.add(slow)
+    scheduler.add(fast)
+    scheduler.advance(4, Clock(scheduler))
+    assert slow.turns == [1, 2, 3, 4]
+    assert fast.turns == [0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4]
+
+
+def test_costlier_actions_take_longer():
+    scheduler = Scheduler(turn_length=1.0)
+    heavy = Dummy(1, cost=2)
+    scheduler.add(heavy)
+    scheduler.advance(5, Clock(scheduler))
+    assert heavy.turns == [1, 3, 5]
+
+
+def test_sleeping_actors_wait_for_wake():
+    scheduler = Scheduler(turn_length=1.0)
+    actor = Dummy(1)
+    scheduler.add(actor)
+    scheduler.sleep(actor)
+    assert actor in scheduler and len(scheduler) == 0
+    scheduler.advance(3, Clock(scheduler))
+    assert actor.turns == []
+    scheduler.wake(actor)
+    scheduler.advance(4, Clock(scheduler))
+    assert actor.turns == [3, 4]
+
+
+def test_idle_actors_sleep_until_woken():
+    scheduler = Scheduler(turn_length=1.0, wake_radius=10)
+    idle = Dummy(1, cost=None)
+    scheduler.add(idle)
+    scheduler.advance(2, Clock(scheduler), focus=(0, 0))
+    assert idle.turns == [1]
+    assert idle in scheduler and len(scheduler) == 0
+    # The focus moving doesn't wake it; only asking does.
+    scheduler.advance(3, Clock(scheduler), focus=(1, 1))
+    assert idle.turns == [1]
+    scheduler.wake(idle)
+    scheduler.advance(3, Clock(scheduler))
+    assert idle.turns == [1, 3]
+
+
+def test_far_actors_sleep_until_the_focus_comes_close():
+    scheduler = Scheduler(turn_length=1.0, wake_radius=10)
+    near = Dummy(1, x=5, y=5)
+    far = Dummy(2, x=100, y=40)
+    scheduler.add(near)
+    scheduler.add(far)
+    scheduler.advance(2, Clock(scheduler), focus=(0, 0))
+    assert near.turns == [1, 2]
+    assert far.turns == []
+    assert scheduler.too_far(far) and not scheduler.too_far(near)
+    scheduler.advance(3, Clock(scheduler), focus=(95, 45))
+    assert far.turns == [2, 3]
+
+
+def test_wake_near_only_looks_at_nearby_buckets():
+    scheduler = Scheduler(turn_length=1.0, wake_radius=10)
+    far = [Dummy(i, x=200 + i, y=200) for i in range(1, 50)]
+    for actor in far:
+        scheduler.add(actor)
+    scheduler.advance(1, Clock(scheduler), focus=(0, 0))
+    assert len(scheduler) == 0 and len(scheduler.sleeping) == len(far)
+    assert scheduler.distant
+    scheduler.wake_near(205, 200, 2)
+    assert sorted(scheduler.scheduled) == [3, 4, 5, 6, 7]
+    scheduler.clear()
+    assert not scheduler.distant and not scheduler.distant_buckets
@@ -0,0 +1,21 @@
+import Thing
+from Thing import Map
+
+
+def test_setting_a_tile_field_survives_eviction():
+    world = Map(name='quadrant', width=325, height=325, min_rooms=5,
+                max_rooms=10, num_exits=2, level=None, region='start',
+                seed=1)
+    x, y = 5, 5
+    tile = world[x][y]
+    tile.glyph = '#'
+    tile.physical = True
+    assert world.opaque[world.index(x, y)]
+    assert not world.walkable[world.index(x, y)]
+    # Enough other chunks to push this one out of the cache and back.
+    world.warm(0, 0, world.width, world.height)
+    assert (x // Thing.CHUNK_SIZE, y // Thing.CHUNK_SIZE) not in world.chunks
+    tile = world[x][y]
+    assert tile.glyph == '#'
+    assert tile.physical is True
+    assert world.opaque[world.index(x, y)]